@@ -0,0 +1,104 @@
+"""
+Module that defines a waiting room indexed by fee / weight ratio, to pack blocks limited by weight without sorting.
+"""
+from bisect import bisect_right
+from collections import deque
+
+import numpy as np
+
+# default number of buckets when the ratios take too many distinct values
+BUCKETS = 256
+
+
+def bucket_edges(ratios, buckets=BUCKETS):
+    """
+    Compute the edges between the buckets of ratios.
+
+    If the ratios take at most `buckets` distinct values, each value has its own bucket so the packing is exactly
+    greedy. Otherwise, edges are quantiles of the ratios so that buckets are evenly filled.
+
+    :param ratios: sample of the fee / weight ratios of the transactions
+    :param buckets: max number of buckets
+    :return: sorted list of the inner edges, bucket k holds the ratios in [edges[k - 1], edges[k])
+    """
+    values = np.unique(ratios)
+    if len(values) <= buckets:
+        return values[1:].tolist()
+    return np.unique(np.quantile(ratios, np.linspace(0, 1, buckets + 1)[1:-1])).tolist()
+
+
+class BucketQueue:
+    """
+    Waiting room made of buckets of fee / weight ratios (a histogram queue), each of them a FIFO of transactions.
+
+    Adding a transaction costs O(log buckets). Packing a block costs O(buckets + scanned transactions): buckets are
+    scanned from the highest ratios, each of them in arrival order, until the block is full.
+    """
+
+    def __init__(self, edges):
+        """
+        :param edges: sorted list of the inner edges between buckets, see bucket_edges
+        """
+        self.edges = edges
+        self.buckets = [deque() for _ in range(len(edges) + 1)]
+        self.size = 0
+        # bucket of the last added transaction
+        self.last = None
+        # lowest weight of the added transactions, no other transaction fits in a block with less room left
+        self.min_weight = float('inf')
+
+    def __len__(self):
+        return self.size
+
+    def append(self, tx):
+        """
+        :param tx: the transaction entering the waiting room
+        """
+        self.last = self.buckets[bisect_right(self.edges, tx.ratio)]
+        self.last.append(tx)
+        self.size += 1
+        self.min_weight = min(self.min_weight, tx.weight)
+
+    def pop(self):
+        """
+        Remove the last added transaction, it must not have been selected since.
+
+        :return: the removed transaction
+        """
+        self.size -= 1
+        return self.last.pop()
+
+    def pack(self, capacity, max_count):
+        """
+        Greedily select the transactions with the highest fee / weight ratios, as long as they fit in the block:
+        a transaction that doesn't fit is skipped, and the next ones are still considered.
+        The packing is exactly greedy when each distinct ratio has its own bucket (see bucket_edges), transactions
+        with equal ratios being taken in arrival order. Otherwise, the ratios within a bucket aren't ordered.
+
+        :param capacity: max total weight of the block
+        :param max_count: max number of transactions in the block
+        :return: the list of selected transactions, removed from the waiting room
+        """
+        # a copy, as parameters may be 0-d arrays which would be modified in place
+        capacity = float(capacity)
+        selected = []
+        for bucket in reversed(self.buckets):
+            if len(selected) >= max_count or capacity < self.min_weight:
+                break
+
+            # the bucket is rotated, the skipped transactions going back to its end in their order
+            skipped = 0
+            for _ in range(len(bucket)):
+                if len(selected) >= max_count or capacity < self.min_weight:
+                    break
+                tx = bucket.popleft()
+                if tx.weight <= capacity:
+                    capacity -= tx.weight
+                    selected.append(tx)
+                else:
+                    bucket.append(tx)
+                    skipped += 1
+            bucket.rotate(skipped)
+
+        self.size -= len(selected)
+        return selected
@@ -0,0 +1,159 @@
+"""
+Module that stores the measures of simulations on the file system, so they can be analysed again without simulating.
+
+A result is identified by a hash of everything that determines it: the parameters values, the seed entropy, the queue,
+the simulated configurations and the source code of the simulation.
+"""
+import contextlib
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+# modules whose source code determines the result of a simulation
+SOURCES = ['models.py', 'processes.py', 'simulations.py', 'buckets.py', 'leaping.py']
+
+
+def code_version():
+    """
+    :return: a hash of the source code of the modules running the simulations
+    """
+    digest = hashlib.sha256()
+    for source in SOURCES:
+        digest.update((Path(__file__).parent / source).read_bytes())
+    return digest.hexdigest()
+
+
+def fingerprint(p, **context):
+    """
+    Hash the parameters values along with any other value identifying a simulation.
+
+    :param p: mapping of the parameters, as returned by Parameters.get_from
+    :param context: other values (seed, queue name, ...), they must have a stable repr
+    :return: an hexadecimal digest
+    """
+    digest = hashlib.sha256()
+    for name in sorted(p):
+        value = p[name]
+        if hasattr(value, 'tocsr'):
+            # sparse matrix, hashed through its CSR components
+            value = value.tocsr(copy=True)
+            value.sum_duplicates()
+            arrays = [value.data, value.indices, value.indptr]
+        else:
+            value = np.asarray(value)
+            arrays = [value]
+        digest.update(f"{name}:{value.dtype}:{value.shape}:".encode())
+        for array in arrays:
+            digest.update(np.ascontiguousarray(array).tobytes())
+    for name in sorted(context):
+        digest.update(f"{name}={context[name]!r};".encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of simulation measures.
+
+    Each entry is a pickle file named after its key. When the cache exceeds its size limit,
+    the least recently used entries are removed (the modification time of an entry is updated each time it is read).
+    """
+
+    def __init__(self, directory, max_size):
+        """
+        :param directory: path of the directory containing the entries, created if it doesn't exist
+        :param max_size: maximum size of the cache in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, p, entropy, queue, configurations):
+        """
+        :param p: mapping of the parameters
+        :param entropy: entropy of the seed sequence initializing the pseudo random generators
+        :param queue: name of the queue (mm1 or mapph1)
+        :param configurations: list of (policy, b) of the simulated systems
+        :return: the key identifying the simulation
+        """
+        configurations = [(policy, int(b)) for policy, b in configurations]
+        return fingerprint(p, entropy=entropy, queue=queue, configurations=configurations, code=code_version())
+
+    def path(self, key):
+        return self.directory / f"{key}.pickle"
+
+    def get(self, key):
+        """
+        :param key: key of the simulation
+        :return: the cached measures, None if there is none
+        """
+        path = self.path(key)
+        try:
+            with path.open('rb') as file:
+                measures = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # marks the entry as recently used, unless another process has just removed it
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return measures
+
+    def put(self, key, measures):
+        """
+        Store the measures, then evict the least recently used entries if the cache is too large
+
+        :param key: key of the simulation
+        :param measures: the measures returned by the simulation
+        """
+        path = self.path(key)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('wb') as file:
+            pickle.dump(measures, file, protocol=pickle.HIGHEST_PROTOCOL)
+        # an entry is either complete or missing, even if the process is interrupted
+        os.replace(tmp, path)
+
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits in its size limit
+
+        :param keep: path of an entry never removed, the one just stored (even if it alone exceeds the limit)
+        """
+        entries = []
+        for entry in self.directory.glob('*.pickle'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # removed by another process sharing the cache
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, entry in entries:
+            if size <= self.max_size:
+                break
+            if entry == keep:
+                continue
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+
+    def get_or_run(self, simulate, p, entropy, queue, configurations):
+        """
+        Load the measures of the simulation if they are cached, otherwise run it and store its measures.
+
+        :param simulate: function without parameters that runs the simulation and returns its measures
+        :return: the measures of the simulation
+        """
+        key = self.key(p, entropy, queue, configurations)
+        measures = self.get(key)
+        if measures is not None:
+            print(f"Measures loaded from cache ({key[:12]}).")
+            return measures
+
+        measures = simulate()
+        self.put(key, measures)
+        return measures
@@ -10,9 +10,6 @@ import numpy as np
 
 GRAPH_HANDLERS = []
 
-# use same style as ggplot from R
-plt.style.use('ggplot')
-
 
 class Graph:
     """
@@ -41,10 +38,11 @@ class Graph:
         :return: A wrapper that filters func required parameters, creates the AxesSubplot and pass it along to func
         """
 
+        signature = inspect.signature(func)
+        param_names = [param.name for param in signature.parameters.values()
+                       if param.kind == param.POSITIONAL_OR_KEYWORD and param.name != 'ax']
+
         def wrapper(**parameters):
-            signature = inspect.signature(func)
-            param_names = [param.name for param in signature.parameters.values()
-                           if param.kind == param.POSITIONAL_OR_KEYWORD and param.name != 'ax']
             try:
                 filtered_parameters = {key: parameters[key] for key in param_names}
             except KeyError:
@@ -70,6 +68,9 @@ def draw(**parameters):
     :param parameters: a mapping of parameters names and values,
      containing at least the ones required by the @Graph decorated functions
     """
+    # use same style as ggplot from R
+    plt.style.use('ggplot')
+
     for graph_handler in GRAPH_HANDLERS:
         graph_handler(**parameters)
 
@@ -0,0 +1,305 @@
+"""
+Module that approximately simulates the blockchain system with a MAP/PH/1 queue, for screening studies.
+
+Instead of simulating each transition of the MAP, time is cut in leaps of fixed duration h. The number of arrivals
+during a leap, and the phase of the MAP at its end, are drawn together from their exact distribution, computed once
+with a matrix exponential. The arrivals are then spread uniformly within their leap. The PH services are simulated
+exactly.
+
+The approximation comes from:
+- the arrival times within a leap, exact for a Poisson process only. Arrivals may thus be put on the wrong side of a
+  block selection, at most λh per selection where λ is the arrival rate.
+- the truncation of the number of arrivals during a leap, whose probability is reported.
+"""
+import time
+
+import numpy as np
+
+from processes import SELECTION, Map, PhaseType
+
+# expected number of arrivals per leap, when the leap duration isn't given
+ARRIVALS_PER_LEAP = 8
+
+
+def arrival_rate(C, D, omega):
+    """
+    :return: the mean arrival rate of the MAP, from its stationary probability vector
+    """
+    # row sums without densifying a sparse D
+    return float(omega @ np.asarray(D.sum(axis=1)).ravel())
+
+
+def counting_table(C, D, h, tolerance=1e-12):
+    """
+    Compute the joint distribution of the number of arrivals N(h) during a leap of duration h and of the phase J(h) at
+    the end of the leap, given the phase J(0) at the beginning of the leap.
+
+    It is the first block row of the matrix exponential of the generator of the MAP counting process, truncated to
+    n_max arrivals. n_max is increased until the truncated probability is below tolerance. Only the first block row is
+    computed, as the action of the exponential on len(C) vectors, with the sparse generator: the cost scales with the
+    non zero entries of C and D times len(C), rather than with the cube of the size of the generator.
+
+    :param C: C+D = infinitesimal generator of an irreducible Markov process
+    :param D: C+D = infinitesimal generator of an irreducible Markov process (arrival)
+    :param h: duration of a leap
+    :param tolerance: maximum probability of more than n_max arrivals during a leap
+    :return: a tuple (cumulative, truncated) where cumulative[i] is the cumulative distribution of n * len(C) + j for
+     P(N(h) = n, J(h) = j | J(0) = i), and truncated is the highest probability of more than n_max arrivals. The
+     distributions are renormalised, the truncated probability being spread over the other outcomes.
+    """
+    from scipy import sparse
+    from scipy.sparse.linalg import expm_multiply
+
+    C = sparse.csr_matrix(C, dtype=float)
+    D = sparse.csr_matrix(D, dtype=float)
+    m = C.shape[0]
+
+    mean = np.asarray(D.sum(axis=1)).max() * h
+    n_max = int(np.ceil(mean + 10 * np.sqrt(mean) + 10))
+    while True:
+        # generator of (number of arrivals, phase), arrivals beyond n_max are lost
+        Q = sparse.kron(sparse.identity(n_max + 1), C) + sparse.kron(sparse.eye(n_max + 1, k=1), D)
+        # rows of the first block row of expm(Q h), as columns of expm(Q.T h) applied to the first unit vectors
+        probabilities = expm_multiply(Q.T.tocsr() * h, np.eye((n_max + 1) * m, m)).T
+        probabilities[probabilities < 0] = 0
+
+        truncated = max(1 - probabilities.sum(axis=1).min(), 0)
+        if truncated <= tolerance:
+            break
+        n_max *= 2
+
+    cumulative = np.cumsum(probabilities, axis=1)
+    cumulative /= cumulative[:, -1:]
+    return cumulative, truncated
+
+
+def duration(ph):
+    """
+    Simulate the PH process until its absorption.
+
+    :param ph: PhaseType process, in its initial state
+    :return: the time to absorption, the process is then reset to a new initial state
+    """
+    elapsed = 0
+    while True:
+        elapsed += ph.g.exponential(1 / ph.exit_rates[ph.state])
+        if ph.transition(ph.g.random()):
+            ph.absorption()
+            return elapsed
+
+
+class Room:
+    """
+    Waiting room of a blockchain system holding the indices of the transactions, with its own policy and block size.
+    """
+
+    def __init__(self, g, policy, b):
+        """
+        :param g: pseudo random generator used to randomly select transactions
+        :param policy: transactions selection policy, random or fees (weight limited blocks aren't supported)
+        :param b: max number of transactions in a block
+        """
+        assert policy in ('random', 'fees'), f"Policy {policy!a} isn't supported by the leaping simulation."
+
+        self.g = g
+        self.policy = policy
+        self.b = b
+        self.waiting_room = np.empty(0, dtype=np.int64)
+        self.server_room = np.empty(0, dtype=np.int64)
+
+        # selections and broadcasts, as lists of (transactions indices, time) and blocks records
+        self.selections = []
+        self.broadcasts = []
+        self.blocks = []
+        self.room_times = []
+        self.room_sizes = []
+
+    def arrivals(self, indices, times, record):
+        """
+        :param indices: indices of the arriving transactions
+        :param times: times of the arrivals
+        :param record: mask of the arrivals to record
+        """
+        self.room_times.append(times[record])
+        self.room_sizes.append(len(self.waiting_room) + np.arange(1, len(indices) + 1)[record])
+        self.waiting_room = np.concatenate([self.waiting_room, indices])
+
+    def selection(self, t, all_ratios, record):
+        """
+        :param t: time of the selection
+        :param all_ratios: fee / weight ratios of all the transactions
+        :param record: if the selection must be recorded
+        """
+        b = self.b
+        if b >= len(self.waiting_room):
+            self.waiting_room, self.server_room = self.waiting_room[:0], self.waiting_room
+        elif self.policy == 'fees':
+            # the b highest ratios, the latest arrivals first among equal ratios as simulations.System does.
+            # The waiting room stays in arrival order (increasing indices), so ties are broken by position.
+            ratios = all_ratios[self.waiting_room]
+            kth = np.partition(ratios, len(ratios) - b)[len(ratios) - b]
+            selected = ratios > kth
+            ties = np.flatnonzero(ratios == kth)
+            selected[ties[len(ties) - (b - selected.sum()):]] = True
+            self.server_room = self.waiting_room[selected]
+            self.waiting_room = self.waiting_room[~selected]
+        else:
+            order = self.g.permutation(len(self.waiting_room))
+            self.server_room = self.waiting_room[order[:b]]
+            self.waiting_room = self.waiting_room[order[b:]]
+
+        self.selections.append((self.server_room, t))
+        self.blocks.append((t, len(self.server_room), np.nan, record))
+        if record:
+            self.room_times.append(np.array([t]))
+            self.room_sizes.append(np.array([len(self.waiting_room)]))
+
+    def broadcast(self, t):
+        """
+        :param t: time of the broadcast
+        """
+        self.broadcasts.append((self.server_room, t))
+        selection, size, _, record = self.blocks[-1]
+        self.blocks[-1] = (selection, size, t, record)
+
+    def measures(self, arrivals, ratios, recorded):
+        """
+        :param arrivals: arrival times of all the transactions
+        :param ratios: fee / weight ratios of all the transactions
+        :param recorded: mask of the transactions to record
+        :return: the recorded measures, with the same keys as simulations.System.measures, but as numpy record arrays
+         with the same fields as Tx, Block and RoomState.
+        """
+        selections = np.full(len(arrivals), np.nan)
+        for indices, t in self.selections:
+            selections[indices] = t
+        broadcasts = np.full(len(arrivals), np.nan)
+        for indices, t in self.broadcasts:
+            broadcasts[indices] = t
+
+        blocks = [block[:3] for block in self.blocks if block[3]]
+
+        return {
+            'transactions': np.rec.fromarrays([ratios[recorded], arrivals[recorded],
+                                               selections[recorded], broadcasts[recorded]],
+                                              names='ratio,arrival,selection,broadcast'),
+            'blocks': np.rec.fromrecords(blocks, names='selection,size,broadcast') if blocks else
+            np.rec.fromarrays([np.empty(0), np.empty(0, dtype=int), np.empty(0)], names='selection,size,broadcast'),
+            'room_states': np.rec.fromarrays([np.concatenate(self.room_times), np.concatenate(self.room_sizes)],
+                                             names='t,size'),
+        }
+
+
+def leaping_simulation(generators, configurations,
+                       sigma, tau, upsilon,
+                       C, D, omega,
+                       S, beta,
+                       T, alpha,
+                       ratios,
+                       leap=None,
+                       **p):
+    """
+    Approximately simulate the blockchain systems with a MAP/PH/1 queue, from t=0 to t=tau+upsilon.
+
+    See simulations.map_ph_simulation for undocumented parameters.
+
+    :param generators: Pseudo random generators (use indices 5 to 9)
+    :param leap: duration of a leap, such that ARRIVALS_PER_LEAP arrivals are expected per leap by default
+    :return: the measures recorded during the simulation, one per configuration (see Room.measures)
+    """
+    print("Leaping simulation started.")
+    start = time.perf_counter()
+
+    g = generators[8]
+    g_leaps = generators[9]
+
+    h = leap or ARRIVALS_PER_LEAP / arrival_rate(C, D, omega)
+    cumulative, truncated = counting_table(C, D, h)
+    m = cumulative.shape[0]
+
+    arrival_process = Map(generators[5], C=C, D=D, stationary_probabilities=omega)
+    ph = PhaseType(generators[6], name='selection', M=S, stationary_probabilities=beta)
+    inactive_ph = PhaseType(generators[7], name='broadcast', M=T, stationary_probabilities=alpha)
+
+    rooms = [Room(g, policy, b) for policy, b in configurations]
+    fees = any(room.policy == 'fees' for room in rooms)
+
+    # arrivals generated in advance, from the end of the last released arrival to the end of the last leap
+    pending = []
+    generated = 0
+    all_arrivals = []
+    # fee / weight ratios of the released transactions, with a capacity doubled when full
+    all_ratios = np.empty(1024)
+    released = 0
+
+    t = 0
+    while t < tau + upsilon:
+        t += duration(ph)
+
+        # generating the leaps up to the service epoch
+        uniforms = g_leaps.random(max(int(np.ceil((t - generated) / h)), 0))
+        for u in uniforms:
+            idx = np.searchsorted(cumulative[arrival_process.state], u, side='right')
+            n, arrival_process.state = divmod(idx, m)
+            pending.append(generated + h * np.sort(g_leaps.random(n)))
+            generated += h
+
+        # releasing the arrivals before the service epoch
+        leaps = np.concatenate(pending) if pending else np.empty(0)
+        times = leaps[leaps <= t]
+        pending = [leaps[leaps > t]]
+
+        indices = np.arange(released, released + len(times))
+        while released + len(times) > len(all_ratios):
+            all_ratios = np.concatenate([all_ratios, np.empty(len(all_ratios))])
+        all_ratios[indices] = g.choice(ratios, len(times)) if fees else 0
+        released += len(times)
+        all_arrivals.append(times)
+
+        record = (sigma <= times) & (times < tau)
+        for room in rooms:
+            room.arrivals(indices, times, record)
+
+        if ph.event == SELECTION:
+            for room in rooms:
+                room.selection(t, all_ratios, sigma <= t < tau)
+        else:
+            for room in rooms:
+                room.broadcast(t)
+        ph, inactive_ph = inactive_ph, ph
+
+    arrivals = np.concatenate(all_arrivals)
+    recorded = (sigma <= arrivals) & (arrivals < tau)
+
+    print(f"Leaping simulation finished in {time.perf_counter() - start:.0f} seconds.")
+    print(f"""
+    Leap duration : {h:.3f} (at most {arrival_rate(C, D, omega) * h:.1f} arrivals misplaced per selection on average)
+    Truncated probability per leap : {truncated:.1e}
+    """)
+
+    return [room.measures(arrivals, all_ratios[:released], recorded) for room in rooms]
+
+
+def approximation_error(approximate_stats, exact_stats):
+    """
+    Print and return the relative error of the means of the approximate simulation, compared to the exact simulation.
+
+    :param approximate_stats: statistics of the leaping simulation, as returned by compute_print_stats
+    :param exact_stats: statistics of the exact simulation, as returned by compute_print_stats
+    :return: mapping of each measure to its relative error
+    """
+    approximate_metrics = approximate_stats['summary'].metrics
+    exact_metrics = exact_stats['summary'].metrics
+    errors = {}
+    for measure, exact in exact_metrics.items():
+        errors[measure] = abs(approximate_metrics[measure].mean - exact.mean) / abs(exact.mean)
+
+    print("\n    Relative error of the leaping simulation :")
+    for measure, error in errors.items():
+        # if the exact mean is outside the confidence interval of the approximate mean
+        approximate, exact = approximate_metrics[measure], exact_metrics[measure].mean
+        outside = approximate.low > exact or exact > approximate.high
+        print(f"    {measure} : {error:.2%}{' (outside the confidence interval)' if outside else ''}")
+    print()
+
+    return errors
@@ -5,12 +5,11 @@ import argparse
 import time
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 from numpy.random import SeedSequence, SFC64, Generator
 
-import graphs
+from cache import ResultCache
 from parameters import Parameters
-from simulations import mm1_simulation, map_ph_simulation
+from simulations import POLICIES, mm1_simulation, map_ph_simulation
 from stats import compute_print_stats
 
 SEED_SEQUENCE = SeedSequence()
@@ -21,55 +20,165 @@ def main():
     description = 'Simulate a proof-of-work blockchain system with a M/M/1 or MAP/PH/1 queue, with fees or not.'
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument('parameters_dir', nargs='?', type=str, default='parameters',
-                        help='path to directory containing the parameters (README for details)')
+                        help='path to directory containing the parameters, or to a compiled bundle '
+                             '(README for details)')
+    parser.add_argument('--compile', type=str, metavar='BUNDLE',
+                        help='validate the parameters and compile them into the single file BUNDLE, then exit')
     parser.add_argument('--seed', type=int, help='seed to initialize the pseudo random generator')
     parser.add_argument('--mm1', action='store_true', help='run the simulation with M/M/1 queue')
     parser.add_argument('--mapph1', action='store_true', help='run the simulation with MAP/PH/1 queue')
     parser.add_argument('--fees', action='store_true',
                         help='Prioritize transactions according to offered fees (otherwise, random order)')
+    parser.add_argument('--weight', action='store_true',
+                        help='Pack blocks by fee / weight ratio, up to a max block weight W (otherwise, random order)')
+    parser.add_argument('--compare', action='store_true',
+                        help='simulate random order, fees prioritization and weight packing from the same events')
+    parser.add_argument('--block-sizes', type=int, nargs='+', metavar='B',
+                        help='max numbers of transactions in a block to simulate from the same events (default: b)')
+    parser.add_argument('--fast', action='store_true',
+                        help='approximate the MAP/PH/1 simulation by drawing the arrivals in leaps of fixed duration')
+    parser.add_argument('--leap', type=float, help='duration of a leap (with --fast, default: 8 expected arrivals)')
+    parser.add_argument('--fast-check', action='store_true',
+                        help='also run the exact MAP/PH/1 simulation and report the approximation error (with --fast)')
+    parser.add_argument('--tail', type=float, metavar='THRESHOLD',
+                        help='estimate the probability that a transaction with the lowest fee / weight ratio has a '
+                             'confirmation time above THRESHOLD, with multilevel splitting (instead of simulating)')
+    parser.add_argument('--levels', type=int, default=10, help='number of splitting levels (with --tail)')
+    parser.add_argument('--effort', type=int, default=100, help='number of copies simulated per level (with --tail)')
+    parser.add_argument('--replications', type=int, default=10,
+                        help='number of independent estimations (with --tail)')
+    parser.add_argument('--warmup', type=float,
+                        help='time simulated before tagging a transaction (with --tail, default: sigma)')
+    parser.add_argument('--cache-dir', type=str, default='.cache',
+                        help='path to directory caching the measures of previous simulations')
+    parser.add_argument('--cache-size', type=int, default=1024, help='maximum size of the cache in MiB')
+    parser.add_argument('--no-cache', action='store_true', help='always run the simulations, and do not cache them')
+    parser.add_argument('--bootstrap', action='store_true',
+                        help='compute the confidence intervals by block bootstrap (otherwise, batch means)')
+    parser.add_argument('--no-graphs', action='store_true', help='only print the statistics, without drawing graphs')
     args = parser.parse_args()
 
+    if args.compile:
+        digest = Parameters.compile(Path(args.parameters_dir), Path(args.compile))
+        print(f"Parameters compiled into {args.compile} ({digest[:12]}).")
+        return
+
+    if not (args.mm1 or args.mapph1):
+        parser.print_help()
+        exit("You didn't select any simulation to run.")
+    if args.fast and args.weight:
+        exit("The leaping simulation doesn't support weight packing.")
+
     # Parsing parameters from file system
-    p = Parameters.get_from(Path(args.parameters_dir))
+    p = Parameters.load(Path(args.parameters_dir))
 
     # Initiating pseudo random generator
     global SEED_SEQUENCE
     if args.seed:
         SEED_SEQUENCE = SeedSequence(args.seed)
     print('Seed :', SEED_SEQUENCE.entropy)
-    generators = [Generator(SFC64(stream)) for stream in SEED_SEQUENCE.spawn(10)]
+
+    # Systems simulated from the same events, one per selection policy and block size
+    if args.compare:
+        # the leaping simulation doesn't support weight packing
+        policies = ['random', 'fees'] if args.fast else list(POLICIES)
+    elif args.weight:
+        policies = ['weight']
+    else:
+        policies = ['fees' if args.fees else 'random']
+    block_sizes = args.block_sizes or [int(p['b'])]
+    configurations = [(policy, b) for policy in policies for b in block_sizes]
+
+    # Caching measures, to skip the simulations already run with the same parameters and seed
+    cache = None if args.no_cache else ResultCache(Path(args.cache_dir), args.cache_size * 2 ** 20)
+
+    def run(simulate, queue):
+        """
+        :param simulate: function running a simulation with the pseudo random generators it receives
+        :param queue: name of the simulated queue, identifying the simulation in the cache
+        :return: the measures of the simulation
+        """
+        def simulate_from_seed():
+            # each simulation receives its own generators from the seed, so that its measures don't depend on the
+            # simulations run before it, nor on which of them were loaded from the cache
+            generators = [Generator(SFC64(stream)) for stream in SeedSequence(SEED_SEQUENCE.entropy).spawn(10)]
+            return simulate(generators)
+
+        if cache is None:
+            return simulate_from_seed()
+        return cache.get_or_run(simulate_from_seed, p, SEED_SEQUENCE.entropy, queue, configurations)
+
+    method = 'bootstrap' if args.bootstrap else 'batch-means'
+
+    def label(queue_name, policy, b):
+        name = queue_name if len(configurations) == 1 else f"{queue_name} b={b}"
+        if policy == 'fees':
+            name += ' with fees'
+        elif policy == 'weight':
+            name += ' with weights'
+        return name
+
+    def analyse(queue_name, all_measures):
+        all_stats = []
+        for (policy, b), measures in zip(configurations, all_measures):
+            name = label(queue_name, policy, b)
+            print(f"{name} :")
+            stats = compute_print_stats(**measures, method=method)
+            if not args.no_graphs:
+                # matplotlib is only imported when graphs are drawn
+                import graphs
+                graphs.draw(**measures, **stats, queue_name=name)
+            all_stats.append(stats)
+        return all_stats
+
+    # Rare events estimations
+    if args.tail is not None:
+        from rare_events import tail_probability
+
+        queues = [('mm1', 'M/M/1', args.mm1), ('mapph1', 'MAP/PH/1', args.mapph1)]
+        for queue, queue_name, selected in queues:
+            for policy, b in configurations if selected else []:
+                print(f"{queue_name} b={b} ({policy}) :")
+                tail_probability(queue, SEED_SEQUENCE.spawn(1)[0], (policy, b), args.tail,
+                                 args.levels, args.effort, args.replications, warmup=args.warmup, **p)
+        return
 
     # Simulations
     if args.mm1:
-        if args.fees:
-            print('M/M/1 with fees :')
-        else:
-            print('M/M/1 :')
+        print('M/M/1 :')
         start = time.perf_counter()
 
-        measures = mm1_simulation(generators, fees=args.fees, **p)
-        stats = compute_print_stats(**measures)
-        graphs.draw(**measures, **stats, queue_name='M/M/1')
+        all_measures = run(lambda generators: mm1_simulation(generators, configurations, **p), 'mm1')
+        analyse('M/M/1', all_measures)
 
         print(f"Done after {time.perf_counter() - start:.0f}s")
 
     if args.mapph1:
-        if args.fees:
-            print('MAP/PH/1 with fees :')
-        else:
-            print('MAP/PH/1 :')
+        print('MAP/PH/1 :')
         start = time.perf_counter()
 
-        measures = map_ph_simulation(generators, fees=args.fees, **p)
-        stats = compute_print_stats(**measures)
-        graphs.draw(**measures, **stats, queue_name='MAP/PH/1')
+        if args.fast:
+            from leaping import leaping_simulation, approximation_error
+
+            def leaping(generators):
+                return leaping_simulation(generators, configurations, leap=args.leap, **p)
+
+            all_measures = run(leaping, f'mapph1-leaping-{args.leap}')
+            all_stats = analyse('MAP/PH/1 (leaping)', all_measures)
+
+            if args.fast_check:
+                exact_measures = run(lambda generators: map_ph_simulation(generators, configurations, **p), 'mapph1')
+                for (policy, b), stats, measures in zip(configurations, all_stats, exact_measures):
+                    print(f"{label('MAP/PH/1 (exact)', policy, b)} :")
+                    approximation_error(stats, compute_print_stats(**measures, method=method))
+        else:
+            all_measures = run(lambda generators: map_ph_simulation(generators, configurations, **p), 'mapph1')
+            analyse('MAP/PH/1', all_measures)
 
         print(f"Done after {time.perf_counter() - start:.0f}s")
 
-    if not (args.mm1 or args.mapph1):
-        parser.print_help()
-        exit("You didn't select any simulation to run.")
-    else:
+    if not args.no_graphs:
+        import matplotlib.pyplot as plt
         plt.show()
 
 
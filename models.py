@@ -17,6 +17,7 @@ class Tx:
     arrival: float  # when it arrives into the queue
     selection: float = None  # when it was selected in a block
     broadcast: float = None  # when the containing block was broadcast
+    weight: float = 0  # weight of the transaction (WU)
 
 
 @dataclass
@@ -2,11 +2,20 @@
 Module which defines and parse the parameters required to run the simulation
 """
 import builtins
+import hashlib
 import inspect
+import pickle
+from functools import lru_cache
 from keyword import iskeyword
+from pathlib import Path
 
 import numpy as np
 
+from cache import fingerprint
+
+# version of the layout of compiled parameter bundles, see Parameters.compile
+BUNDLE_FORMAT = 2
+
 
 class Rule:
     """
@@ -15,6 +24,34 @@ class Rule:
     pass
 
 
+@lru_cache(maxsize=None)
+def arguments(func):
+    """
+    :param func: a converter or the lambda of a rule
+    :return: the names of its parameters, inspected once per function
+    """
+    return tuple(inspect.signature(func).parameters)
+
+
+def sources_signature(_dir):
+    """
+    :param _dir: the path to the directory containing the files defining all the parameters
+    :return: name, size and modification time of each file of the directory
+    """
+    signature = []
+    for file in sorted(_dir.iterdir()):
+        stat = file.stat()
+        signature.append((file.name, stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def definitions_version():
+    """
+    :return: a hash of this module, which defines the parameters, their converters and rules
+    """
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
 class Parameters:
     """
     Defines all the parameters required to run the simulations.
@@ -49,24 +86,36 @@ class Parameters:
     C: float
     D: float
     omega: float
-    map_dimensions: Rule = lambda C, D, omega: len(C) == len(D) == len(omega), "C, D and omega must have the same size!"
+    map_dimensions: Rule = lambda C, D, omega: C.shape[0] == D.shape[0] == len(omega), \
+                           "C, D and omega must have the same size!"
 
     S: float
     beta: float
-    ph_selection_size: Rule = lambda S, beta: len(S) == len(beta), "S and beta must have the same size!"
+    ph_selection_size: Rule = lambda S, beta: S.shape[0] == len(beta), "S and beta must have the same size!"
 
     T: float
     alpha: float
-    ph_broadcast_size: Rule = lambda T, alpha: len(T) == len(alpha), "T and alpha must have the same size!"
+    ph_broadcast_size: Rule = lambda T, alpha: T.shape[0] == len(alpha), "T and alpha must have the same size!"
 
     ratios: float
+    weights: float
+    W: float
+    weights_size: Rule = lambda ratios, weights: len(ratios) == len(weights), \
+                         "ratios and weights must have the same size!"
+    weights_min: Rule = lambda weights: (weights > 0).all(), "weights must be strictly positive"
+    W_min: Rule = lambda W, weights: W >= weights.max(), \
+                  "W must be at least the largest weight, for any transaction to fit"
 
     @classmethod
     def get_from(cls, _dir):
         """
         Load all parameters from _dir
 
-        :param _dir: the path to the directory containing the csv files defining all the parameters
+        A parameter is either defined by a csv file, or by a npz file holding a sparse matrix
+        (see scipy.sparse.save_npz).
+        Sparse matrices are loaded in CSR format.
+
+        :param _dir: the path to the directory containing the files defining all the parameters
         :return: A mapping of the parameters and their value
         :rtype: dict
         """
@@ -90,6 +139,17 @@ class Parameters:
             except KeyError:
                 exit(f"Parameter definition for {param_name!a} is missing its type annotation.")
 
+            assert param_name not in p, f"Parameter {param_name!a} is defined by several files."
+
+            if file.suffix == '.npz':
+                # scipy is only imported when a parameter is sparse
+                from scipy import sparse
+                try:
+                    p[param_name] = sparse.load_npz(file).tocsr().astype(dtype)
+                except ValueError:
+                    exit(f"Could not parse {file}, should be a sparse matrix saved with scipy.sparse.save_npz!")
+                continue
+
             try:
                 p[param_name] = np.loadtxt(file, delimiter=',', dtype=dtype)
             except ValueError:
@@ -102,8 +162,7 @@ class Parameters:
         convertibles = [pd for pd in param_definitions if hasattr(cls, pd)]
         for param_name in convertibles:
             converter = getattr(cls, param_name)
-            sig = inspect.signature(converter)
-            args = [p[arg] for arg in sig.parameters]
+            args = [p[arg] for arg in arguments(converter)]
 
             p[param_name] = converter(*args)
 
@@ -114,8 +173,79 @@ class Parameters:
             rule_func = getattr(cls, rule_name)[0]
             fail_msg = getattr(cls, rule_name)[1]
 
-            sig = inspect.signature(rule_func)
-            args = [p[arg] for arg in sig.parameters]
+            args = [p[arg] for arg in arguments(rule_func)]
             assert rule_func(*args), fail_msg
 
         return p
+
+    @classmethod
+    def compile(cls, _dir, bundle):
+        """
+        Load and validate all parameters from _dir, then write them to a single binary file (a bundle) along with
+        their fingerprint, so that they can be loaded again without parsing nor checking them.
+        The bundle also records the files of _dir and the version of the definitions, to detect when it is outdated.
+
+        :param _dir: the path to the directory containing the files defining all the parameters
+        :param bundle: the path of the bundle to write
+        :return: the fingerprint of the parameters (see cache.fingerprint)
+        """
+        p = cls.get_from(_dir)
+        digest = fingerprint(p)
+        content = pickle.dumps({'format': BUNDLE_FORMAT,
+                                'fingerprint': digest,
+                                'directory': str(_dir.resolve()),
+                                'sources': sources_signature(_dir),
+                                'definitions': definitions_version(),
+                                'parameters': p},
+                               protocol=pickle.HIGHEST_PROTOCOL)
+        # a bundle is either complete or missing, even if the process is interrupted
+        tmp = bundle.with_name(f'{bundle.name}.tmp')
+        tmp.write_bytes(content)
+        tmp.replace(bundle)
+        return digest
+
+    @classmethod
+    def get_from_bundle(cls, bundle):
+        """
+        Load all parameters from a bundle written by Parameters.compile, in a single read.
+        The parameters were checked when compiled. The bundle is rejected if its parameters don't match their
+        fingerprint, if the definitions of the parameters changed since, or if the files of the directory it was
+        compiled from changed since (when that directory still exists).
+
+        :param bundle: the path to the bundle
+        :return: A mapping of the parameters and their value
+        :rtype: dict
+        """
+        try:
+            content = pickle.loads(bundle.read_bytes())
+        except Exception:
+            content = None
+        if not isinstance(content, dict):
+            exit(f"Could not parse {bundle}, should be a bundle written by Parameters.compile!")
+
+        assert content.get('format') == BUNDLE_FORMAT, \
+            f"Bundle '{bundle}' has format {content.get('format')}, compile it again (expected {BUNDLE_FORMAT})."
+        assert content['definitions'] == definitions_version(), \
+            f"Bundle '{bundle}' was compiled with other parameters definitions, compile it again."
+        directory = Path(content['directory'])
+        if directory.is_dir():
+            assert sources_signature(directory) == content['sources'], \
+                f"Parameters in '{directory}' changed since bundle '{bundle}' was compiled, compile it again."
+        p = content['parameters']
+        assert fingerprint(p) == content['fingerprint'], f"Bundle '{bundle}' is corrupted, compile it again."
+        assert p.keys() == {name for name, definition in cls.__annotations__.items() if
+                            not issubclass(definition, Rule)}, \
+            f"Bundle '{bundle}' doesn't define the current parameters, compile it again."
+
+        return p
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: the path to either a directory containing the parameters files or a bundle
+        :return: A mapping of the parameters and their value, see get_from and get_from_bundle
+        :rtype: dict
+        """
+        if path.is_file():
+            return cls.get_from_bundle(path)
+        return cls.get_from(path)
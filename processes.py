@@ -1,14 +1,196 @@
 """
 Module that defines the stochastic processes used in the simulation.
-Stochastic processes can only provide time and name of associated events (arrival, selection and broadcast).
+Stochastic processes can only provide time and code of associated events (arrival, selection and broadcast).
 It doesn't define the business logic of the blockchain system.
 """
-from functools import cache
+import copy
+import heapq
+from functools import wraps
 
 import numpy as np
 
+# codes of the events, they index the dispatch tables of the simulations
+ARRIVAL = 0
+SELECTION = 1
+BROADCAST = 2
+EVENT_NAMES = ('arrival', 'selection', 'broadcast')
 
-class MapDoublePh:
+
+def identity_cache(maxsize):
+    """
+    Decorator caching the results of a function according to the identity of its arguments.
+    Meant for numpy arrays and sparse matrices, which can't be hashed.
+
+    The arguments are kept along the result, so their identity can't be reused by other objects while cached.
+
+    :param maxsize: max number of cached results, the oldest one is dropped when exceeded
+    """
+
+    def decorator(func):
+        results = {}
+
+        @wraps(func)
+        def wrapper(*args):
+            key = tuple(map(id, args))
+            if key not in results:
+                if len(results) >= maxsize:
+                    del results[next(iter(results))]
+                results[key] = (args, func(*args))
+            return results[key][1]
+
+        wrapper.cache_clear = results.clear
+        return wrapper
+
+    return decorator
+
+
+def diagonal(M):
+    """
+    :param M: dense (array or nested lists) or sparse (scipy.sparse) square matrix
+    :return: the diagonal of M as an array
+    """
+    if hasattr(M, 'tocsr'):
+        return M.diagonal()
+    return np.diagonal(np.asarray(M, dtype=float))
+
+
+def row_sums(M):
+    """
+    :param M: dense (array or nested lists) or sparse (scipy.sparse) matrix
+    :return: the sum of each row of M as an array
+    """
+    if hasattr(M, 'tocsr'):
+        return np.asarray(M.sum(axis=1)).ravel()
+    return np.asarray(M, dtype=float).sum(axis=1)
+
+
+def nonzero_rows(M):
+    """
+    :param M: dense (array or nested lists) or sparse (scipy.sparse) matrix
+    :return: for each row of M, a tuple (columns, values) of its non zero entries
+    """
+    if hasattr(M, 'tocsr'):
+        M = M.tocsr()
+        return [(M.indices[M.indptr[i]:M.indptr[i + 1]], M.data[M.indptr[i]:M.indptr[i + 1]])
+                for i in range(M.shape[0])]
+
+    rows = []
+    for row in np.asarray(M, dtype=float).reshape(np.shape(M)[0], -1):
+        columns = np.flatnonzero(row)
+        rows.append((columns, row[columns]))
+    return rows
+
+
+def transition_table(*blocks):
+    """
+    Tabulate, for each state of a Markov process, the transitions it can make and their probabilities.
+
+    The rates of the transitions are given by blocks of columns (e.g. C then D for a MAP), all with one row per state.
+    A transition is identified by its column index in the concatenation of the blocks.
+    Diagonal entries of the first block (the rate of leaving the state) and entries that are not strictly positive are
+    not transitions, so the table only holds the non zero entries: its size scales with the non zero entries of the
+    blocks rather than with their size.
+
+    :param blocks: dense or sparse matrices defining the rates of the transitions
+    :return: for each state, a tuple (targets, cumulative probabilities) where targets are the column indices of the
+     possible transitions
+    """
+    block_rows = [nonzero_rows(block) for block in blocks]
+
+    table = []
+    for state in range(len(block_rows[0])):
+        targets = []
+        weights = []
+        offset = 0
+        for idx, block in enumerate(blocks):
+            columns, values = block_rows[idx][state]
+            keep = values > 0
+            if idx == 0:
+                keep &= columns != state
+            targets.append(columns[keep] + offset)
+            weights.append(values[keep])
+            offset += np.shape(block)[1]
+
+        cumulative = np.cumsum(np.concatenate(weights))
+        if len(cumulative):
+            cumulative /= cumulative[-1]
+        table.append((np.concatenate(targets), cumulative))
+
+    return table
+
+
+@identity_cache(maxsize=16)
+def map_tables(C, D):
+    """
+    :param C: C+D = infinitesimal generator of an irreducible Markov process
+    :param D: C+D = infinitesimal generator of an irreducible Markov process (arrival)
+    :return: the exit rates and the transition table of the MAP states
+    """
+    return -diagonal(C), transition_table(C, D)
+
+
+@identity_cache(maxsize=16)
+def ph_tables(M):
+    """
+    :param M: infinitesimal generator of PH process
+    :return: the absorbing rates, the exit rates and the transition table of the PH states
+    """
+    absorbing_probabilities = -row_sums(M)
+    return absorbing_probabilities, -diagonal(M), transition_table(M, absorbing_probabilities.reshape(-1, 1))
+
+
+class Scheduler:
+    """
+    Control the flow of time (self.t) and events (self.next) of a simulation, with an event calendar.
+
+    The calendar is a binary heap of event sources, ordered by the time of their next event. A source is a callable
+    without parameters, called when its time comes (self.t is then its time). It may schedule itself or other sources
+    again, and returns the code of its event, or None if the event is silent (e.g. a phase change).
+    Simultaneous events occur in the order they were scheduled.
+
+    Subclasses schedule their sources on initialization. Each event costs O(log n) for n scheduled sources.
+    """
+    # name of the method giving the time of the next event of each source, see redraw
+    TIMINGS = {}
+
+    def __init__(self):
+        self.t = 0
+        self.calendar = []
+        # number of scheduled events, breaks ties between simultaneous events
+        self.scheduled = 0
+
+    def schedule(self, t, source):
+        """
+        :param t: time of the next event of source
+        :param source: callable returning the code of its event, or None
+        """
+        self.scheduled += 1
+        heapq.heappush(self.calendar, (t, self.scheduled, source))
+
+    def next(self):
+        """
+        Elapse time to the next event that isn't silent and returns its code
+
+        :return: the code of the event occurring now
+        """
+        while True:
+            self.t, _, source = heapq.heappop(self.calendar)
+            code = source()
+            if code is not None:
+                return code
+
+    def redraw(self):
+        """
+        Draw again the times of the scheduled events from the current time, with the current pseudo random generators.
+        Valid as the sojourn times of all the sources are exponential, hence memoryless.
+        The timing of each source is given by the method named in self.TIMINGS after the name of the source.
+        """
+        self.calendar = [(getattr(self, self.TIMINGS[source.__name__])(), scheduled, source)
+                         for _, scheduled, source in self.calendar]
+        heapq.heapify(self.calendar)
+
+
+class MapDoublePh(Scheduler):
     """
     A stochastic process composed of a Map and two PhaseType service processes.
     The service processes, selection and broadcast, are mutually exclusive:
@@ -16,13 +198,19 @@ class MapDoublePh:
       - When the active PhaseType process is absorbed, it is swapped with the other one
       - Server starts with selection
     It is initiated at time 0 (self.t) and time elapses with the method `next`.
+
+    MAP and the active PH are two sources competing on the calendar, each scheduling its next transition.
+    Their sojourn times being exponential, a transition of one of them doesn't change the time of the other.
     """
+    TIMINGS = {'map_transition': 'next_map_transition', 'ph_transition': 'next_ph_transition'}
 
     def __init__(self, generators,
                  C, D, omega,
                  S, beta,
                  T, alpha):
         """
+        The matrices can be dense or sparse (scipy.sparse).
+
         :param generators: array of pseudo random generators (uses indices 5 to 9)
         :param C: C+D = infinitesimal generator of an irreducible Markov process
         :param D: C+D = infinitesimal generator of an irreducible Markov process (arrival)
@@ -32,94 +220,51 @@ class MapDoublePh:
         :param T: infinitesimal generator of PH process (broadcast)
         :param alpha: stationary probability vector of PH (broadcast)
         """
+        super().__init__()
         self.g = generators[9]
 
-        self.t = 0
-
         self.map = Map(generators[5], C=C, D=D, stationary_probabilities=omega)
         self.ph = PhaseType(generators[6], name='selection', M=S, stationary_probabilities=beta)
         self.inactive_ph = PhaseType(generators[7], name='broadcast', M=T, stationary_probabilities=alpha)
 
-        # events of MAP/PH/1 are represented by their index in this vector
-        self.events = list(range(len(C) + len(D) + len(S) + 1))
-        # ph can have different sizes, so we need two of them
-        self.inactive_events = list(range(len(C) + len(D) + len(T) + 1))
+        self.schedule(self.next_map_transition(), self.map_transition)
+        self.schedule(self.next_ph_transition(), self.ph_transition)
 
-    def next(self):
+    def next_map_transition(self):
         """
-        Advance the time of the simulation until MAP has an arrival or PH is absorbed,
-         and returns the name of the associated event.
-
-        :return: name of the realized process
+        :return: timing of the next transition of MAP, estimated at current time
         """
-        self.t += self.g.exponential(1 / - (self.map.C[self.map.state][self.map.state] +
-                                            self.ph.M[self.ph.state][self.ph.state]))
-
-        probabilities = self.get_next_state_prob_vector(self.ph, self.map.state, self.ph.state)
-
-        # Choosing next event, represented by his index
-        next_event = self.g.choice(self.events, 1, p=probabilities)[0]
+        return self.t + self.g.exponential(1 / self.map.exit_rates[self.map.state])
 
-        # Find which event was chosen using his index
-        if next_event < len(self.map.C):
-            self.map.state = next_event
-            return self.next()
-        elif next_event < len(self.map.C) + len(self.map.D):
-            self.map.state = next_event - len(self.map.C)
-            return 'arrival'
-        elif next_event < len(probabilities) - 1:
-            self.ph.state = next_event - len(self.map.C) - len(self.map.C)
-            return self.next()
-        else:
-            try:
-                return self.ph.name
-            finally:
-                # finally is executed after the return is evaluated, but before code calling the method
-                self.ph.absorption()
-                self.ph, self.inactive_ph = self.inactive_ph, self.ph
-                self.events, self.inactive_events = self.inactive_events, self.events
-
-    @cache
-    def get_next_state_prob_vector(self, ph, map_state, ph_state):
+    def next_ph_transition(self):
         """
-        Compute the probability vector for the given state to simulate the next state
-
-        The way it works is that it creates the concatenation of one row of C, D, M plus the
-        absorbing event of M. The rows chosen depend on the state of the map and ph.
-
-        This probability vector enables us to randomly choose the next event while respecting the probability of
-        each event.
-        Each event is identified by its index in this vector (C, then D, then M, then absorbing event of ph).
-        Diagonal elements of matrix C and M are kept, but set to a probability of zero.
-
-        :param ph: self.ph required for cache purpose
-        :param map_state: self.map.state required for cache purpose
-        :param ph_state: self.ph.state required for cache purpose
-        :return: the probability vector of the current state to simulate the next state
+        :return: timing of the next transition of the active PH, estimated at current time
         """
-        # array beginning as weight, then becoming probabilities.
-        # Same array to save execution time
-        probabilities = np.ones(len(self.map.C) + len(self.map.D) + len(ph.M) + 1)
-
-        offset = 0
-        probabilities[offset:len(self.map.C)] = self.map.C[map_state]
+        return self.t + self.g.exponential(1 / self.ph.exit_rates[self.ph.state])
 
-        offset += len(self.map.C)
-        probabilities[offset:offset + len(self.map.D)] = self.map.D[map_state]
-
-        offset += len(self.map.D)
-        probabilities[offset:offset + len(ph.M)] = ph.M[ph_state]
-
-        offset += len(ph.M)
-        probabilities[offset] = ph.absorbing_probabilities[ph_state]
+    def map_transition(self):
+        """
+        Source of the MAP transitions
 
-        # render negative number on the diagonals inoffensive for the purpose of this array by setting them to 0
-        probabilities[probabilities < 0] = 0
+        :return: ARRIVAL, or None for a silent phase change
+        """
+        arrival = self.map.transition(self.g.random())
+        self.schedule(self.next_map_transition(), self.map_transition)
+        return ARRIVAL if arrival else None
 
-        # weights become probabilities
-        probabilities /= probabilities.sum()
+    def ph_transition(self):
+        """
+        Source of the active PH transitions, the PH are swapped on absorption
 
-        return probabilities
+        :return: the event of the PH on absorption (SELECTION or BROADCAST), or None for a phase change
+        """
+        event = None
+        if self.ph.transition(self.g.random()):
+            event = self.ph.event
+            self.ph.absorption()
+            self.ph, self.inactive_ph = self.inactive_ph, self.ph
+        self.schedule(self.next_ph_transition(), self.ph_transition)
+        return event
 
 
 class StatefulProcess:
@@ -142,6 +287,14 @@ class StatefulProcess:
         self.possible_states = list(range(len(self.state_probabilities)))
         self.state = g.choice(self.possible_states, 1, p=self.state_probabilities)[0]
 
+    def __deepcopy__(self, memo):
+        """
+        Copy the state and the pseudo random generator only, the matrices and tables are shared with the copy.
+        """
+        clone = copy.copy(self)
+        clone.g = copy.deepcopy(self.g, memo)
+        return clone
+
 
 class Map(StatefulProcess):
     """
@@ -159,6 +312,24 @@ class Map(StatefulProcess):
         super().__init__(g, stationary_probabilities)
         self.C = C
         self.D = D
+        # transitions to index k < len(C) are silent phase changes, others are arrivals to phase k - len(C)
+        # tables are computed once per couple of matrices
+        self.exit_rates, self.transitions = map_tables(C, D)
+
+    def transition(self, u):
+        """
+        Make the transition designated by u, according to the transitions probabilities of the current state
+
+        :param u: uniform random number in [0, 1)
+        :return: True if the transition is an arrival, False otherwise
+        """
+        targets, cumulative = self.transitions[self.state]
+        target = targets[np.searchsorted(cumulative[:-1], u, side='right')]
+        if target < len(self.transitions):
+            self.state = target
+            return False
+        self.state = target - len(self.transitions)
+        return True
 
     def __str__(self):
         return "<MAP>"
@@ -175,16 +346,35 @@ class PhaseType(StatefulProcess):
         :param g: pseudo random generator to randomly choose a state
         :param M: infinitesimal generator of PH process
         :param stationary_probabilities: stationary probability vector of the process
-        :param name: name of the phenomenon simulated by this process
+        :param name: name of the phenomenon simulated by this process, one of EVENT_NAMES
         """
         super().__init__(g, stationary_probabilities)
         self.M = M
         self.name = name
-        self.absorbing_probabilities = [-sum(row) for row in M]
+        # code of the event occurring on absorption
+        self.event = EVENT_NAMES.index(name)
+        # transitions to index k < len(M) are phase changes, the last one is the absorption
+        # tables are computed once per matrix
+        self.absorbing_probabilities, self.exit_rates, self.transitions = ph_tables(M)
 
     def __str__(self):
         return f"<PH '{self.name}'>"
 
+    def transition(self, u):
+        """
+        Make the transition designated by u, according to the transitions probabilities of the current state.
+        The state is left unchanged on absorption, see absorption.
+
+        :param u: uniform random number in [0, 1)
+        :return: True if the transition is the absorption, False otherwise
+        """
+        targets, cumulative = self.transitions[self.state]
+        target = targets[np.searchsorted(cumulative[:-1], u, side='right')]
+        if target < len(self.transitions):
+            self.state = target
+            return False
+        return True
+
     def absorption(self):
         """
         Randomly set a state, to use after an absorption
@@ -192,7 +382,7 @@ class PhaseType(StatefulProcess):
         self.state = self.g.choice(self.possible_states, 1, p=self.state_probabilities)[0]
 
 
-class MDoubleM:
+class MDoubleM(Scheduler):
     """
     A stochastic process composed of a Poisson arrival process and two exponential service processes.
     The service processes (selection and broadcast) are mutually exclusive:
@@ -201,6 +391,7 @@ class MDoubleM:
       - Server starts with selection
     It is initiated at time 0 (self.t) and time elapses with the method `next`.
     """
+    TIMINGS = {'arrival': 'next_arrival', 'selection': 'next_selection', 'broadcast': 'next_broadcast'}
 
     def __init__(self, generators, _lambda, mu1, mu2):
         """
@@ -210,19 +401,15 @@ class MDoubleM:
         :param mu1: expected service time (selection)
         :param mu2: expected service time (broadcast)
         """
+        super().__init__()
         self.generators = generators
 
         self._lambda = _lambda
         self.mu1 = mu1
         self.mu2 = mu2
 
-        self.t = 0
-        # contains the timing of the next event for each type of event, infinity if None is planned
-        self.planning = {
-            'arrival': self.next_arrival(),
-            'selection': self.next_selection(),
-            'broadcast': float('inf')
-        }
+        self.schedule(self.next_arrival(), self.arrival)
+        self.schedule(self.next_selection(), self.selection)
 
     def next_arrival(self):
         """
@@ -242,22 +429,23 @@ class MDoubleM:
         """
         return self.t + self.generators[2].exponential(self.mu2)
 
-    def next(self):
+    def arrival(self):
         """
-        Elapse time to the next event and returns its name
-
-        :return: the name of the event occurring now
+        Source of the arrivals
         """
-        event_name = min(self.planning, key=self.planning.get)
-        self.t = self.planning[event_name]
+        self.schedule(self.next_arrival(), self.arrival)
+        return ARRIVAL
 
-        if event_name == 'arrival':
-            self.planning['arrival'] = self.next_arrival()
-        elif event_name == 'selection':
-            self.planning['selection'] = float('inf')
-            self.planning['broadcast'] = self.next_broadcast()
-        else:
-            self.planning['broadcast'] = float('inf')
-            self.planning['selection'] = self.next_selection()
+    def selection(self):
+        """
+        Source of the selections, followed by a broadcast
+        """
+        self.schedule(self.next_broadcast(), self.broadcast)
+        return SELECTION
 
-        return event_name
+    def broadcast(self):
+        """
+        Source of the broadcasts, followed by a selection
+        """
+        self.schedule(self.next_selection(), self.selection)
+        return BROADCAST
@@ -0,0 +1,206 @@
+"""
+Module that estimates the probability of rare long confirmation times, by multilevel splitting.
+
+A transaction (the tagged transaction) arrives in a warmed up blockchain system. The probability that its confirmation
+time exceeds a threshold is the product of the conditional probabilities of exceeding successive intermediate levels.
+Each of them is estimated with a fixed effort: a fixed number of copies of the system are simulated from the states
+that exceeded the previous level, until the tagged transaction is confirmed or exceeds the next level.
+"""
+import copy
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.random import SFC64, Generator
+
+from processes import ARRIVAL, MapDoublePh, MDoubleM
+from buckets import bucket_edges
+from simulations import System, step
+
+# build the scheduler of a queue from its parameters, along with the index of its business pseudo random generator
+SCHEDULERS = {
+    'mm1': (lambda generators, _lambda, mu1, mu2, **p: MDoubleM(generators, _lambda, mu1, mu2), 3),
+    'mapph1': (lambda generators, C, D, omega, S, beta, T, alpha, **p:
+               MapDoublePh(generators, C, D, omega, S, beta, T, alpha), 8),
+}
+
+
+@dataclass
+class TailEstimate:
+    threshold: float  # confirmation time the tagged transaction exceeds
+    probability: float  # estimated probability to exceed the threshold
+    relative_error: float  # standard error of the estimate divided by the estimate
+    levels: np.ndarray  # intermediate levels, the last one is the threshold
+    conditional_probabilities: np.ndarray  # mean probability to exceed each level, given the previous one is exceeded
+    events: int  # number of events simulated after the warm up
+    warmup_events: int  # number of events simulated to warm up the replications
+    replications: int  # number of independent splitting runs
+
+
+class Trajectory:
+    """
+    The state of a simulation with a tagged transaction: scheduler, system and pseudo random generators.
+    """
+
+    def __init__(self, scheduler, system, g, generators, tagged):
+        self.scheduler = scheduler
+        self.system = system
+        self.g = g
+        self.generators = generators
+        self.tagged = tagged
+
+    def clone(self, seed_sequence):
+        """
+        Copy the state, with new pseudo random generators so that the copy has its own future.
+        The times of the scheduled events are drawn again, otherwise all the copies would share their next events.
+
+        :param seed_sequence: seed sequence to spawn the new generators from
+        :return: the copy
+        """
+        generators = [Generator(SFC64(stream)) for stream in seed_sequence.spawn(len(self.generators))]
+        # deepcopy uses the memo to replace the generators wherever they are referenced
+        memo = {id(old): new for old, new in zip(self.generators, generators)}
+        memo[id(self.generators)] = generators
+        clone = copy.deepcopy(self, memo)
+        clone.scheduler.redraw()
+        return clone
+
+    def exceeds(self, level, ratios, weights, fees):
+        """
+        Simulate until the tagged transaction is confirmed or its confirmation time exceeds level.
+
+        :param level: confirmation time to exceed
+        :param ratios: a list of fee on weight ratios to randomly choose from
+        :param weights: the weights of the transactions, sampled along the ratios
+        :param fees: if arriving transactions receive a ratio and a weight
+        :return: a tuple (True if the confirmation time exceeds level, number of simulated events)
+        """
+        events = 0
+        while True:
+            if self.tagged.broadcast is not None:
+                return self.tagged.broadcast - self.tagged.arrival > level, events
+            if self.scheduler.t - self.tagged.arrival > level:
+                return True, events
+            step(self.scheduler, [self.system], self.g, ratios, weights, fees, sigma=np.inf, tau=np.inf)
+            events += 1
+
+
+def warm_up(queue, seed_sequence, configuration, warmup, ratio, ratios, weights, W, **p):
+    """
+    Simulate the system until warmup, then tag the next arriving transaction.
+
+    :return: a tuple (the Trajectory of the simulation right after the arrival of the tagged transaction,
+     number of simulated events)
+    """
+    policy, b = configuration
+    generators = [Generator(SFC64(stream)) for stream in seed_sequence.spawn(10)]
+    build_scheduler, g_index = SCHEDULERS[queue]
+    scheduler = build_scheduler(generators, **p)
+    g = generators[g_index]
+    system = System(g, policy, b, W, bucket_edges(ratios))
+    fees = policy != 'random'
+
+    events = 0
+    while scheduler.t < warmup:
+        step(scheduler, [system], g, ratios, weights, fees, np.inf, np.inf)
+        events += 1
+    while step(scheduler, [system], g, ratios, weights, fees, np.inf, np.inf) != ARRIVAL:
+        events += 1
+    events += 1
+
+    # the tagged transaction enters the waiting room again, as its ratio may change its place
+    tagged = system.waiting_room.pop()
+    tagged.ratio = ratio
+    system.waiting_room.append(tagged)
+    return Trajectory(scheduler, system, g, generators, tagged), events
+
+
+def tail_probability(queue, seed_sequence, configuration, threshold,
+                     levels=10, effort=100, replications=10, ratio=None, warmup=None,
+                     sigma=0, ratios=(0,), weights=(0,), W=None, **p):
+    """
+    Estimate the probability that the confirmation time of a transaction exceeds threshold, with fixed effort
+    multilevel splitting on the elapsed confirmation time of a tagged transaction.
+
+    Each replication warms up the system until warmup, tags the next arriving transaction, then estimates the
+    probability as the product of the fraction of copies exceeding each level. The estimator is unbiased, its relative
+    error is computed from the independent replications.
+
+    :param queue: mm1 or mapph1
+    :param seed_sequence: SeedSequence to spawn all the pseudo random generators from
+    :param configuration: (policy, b) of the system, see simulations.simulation
+    :param threshold: confirmation time whose excess probability is estimated
+    :param levels: number of levels, evenly spaced up to threshold
+    :param effort: number of copies simulated for each level
+    :param replications: number of independent estimations, at least 2 to compute the relative error
+    :param ratio: fee / weight ratio of the tagged transaction, the lowest of ratios by default
+    :param warmup: warm up duration, sigma by default
+    :param sigma: time to start recording the measures of a simulation, the default warm up duration
+    :param ratios: a list of fee on weight ratios to randomly choose from
+    :param weights: the weights of the transactions, sampled along the ratios
+    :param W: max weight of a block
+    :param p: parameters of the queue
+    :return: a TailEstimate, also printed
+    """
+    print("Rare event estimation started.")
+    start = time.perf_counter()
+
+    policy, b = configuration
+    ratio = np.min(ratios) if ratio is None else ratio
+    bounds = np.linspace(threshold / levels, threshold, levels)
+    fees = policy != 'random'
+    warmup = sigma if warmup is None else warmup
+
+    estimates = np.empty(replications)
+    conditional_probabilities = np.zeros((replications, levels))
+    events = 0
+    warmup_events = 0
+
+    for replication, replication_seed in enumerate(seed_sequence.spawn(replications)):
+        warmup_seed, splitting_seed = replication_seed.spawn(2)
+        state, state_events = warm_up(queue, warmup_seed, configuration, warmup, ratio, ratios, weights, W, **p)
+        warmup_events += state_events
+        states = [state]
+
+        for idx, level in enumerate(bounds):
+            successes = []
+            # effort is evenly distributed among the states that exceeded the previous level
+            for idx_copy, copy_seed in enumerate(splitting_seed.spawn(effort)):
+                trajectory = states[idx_copy % len(states)].clone(copy_seed)
+                exceeds, trajectory_events = trajectory.exceeds(level, ratios, weights, fees)
+                events += trajectory_events
+                if exceeds:
+                    successes.append(trajectory)
+
+            conditional_probabilities[replication, idx] = len(successes) / effort
+            if not successes:
+                break
+            states = successes
+
+        estimates[replication] = conditional_probabilities[replication].prod()
+
+    probability = estimates.mean()
+    if replications > 1 and probability > 0:
+        relative_error = estimates.std(ddof=1) / np.sqrt(replications) / probability
+    else:
+        relative_error = np.nan
+
+    print(f"Rare event estimation finished in {time.perf_counter() - start:.0f} seconds.")
+    estimate = TailEstimate(threshold=threshold,
+                        probability=float(probability),
+                        relative_error=float(relative_error),
+                        levels=bounds,
+                        conditional_probabilities=conditional_probabilities.mean(axis=0),
+                        events=events,
+                        warmup_events=warmup_events,
+                        replications=replications)
+
+    print(f"""
+    Probability of a confirmation time > {threshold} : {estimate.probability:.3e}
+    Relative error : {estimate.relative_error:.1%} ({replications} replications)
+    Conditional probabilities per level : {', '.join(f'{level:.0f}: {probability:.2f}' for level, probability in
+                                                       zip(estimate.levels, estimate.conditional_probabilities))}
+    Simulated events : {events} for splitting, {warmup_events} to warm up (until {warmup:.0f})
+    """)
+
+    return estimate
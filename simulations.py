@@ -3,90 +3,206 @@ Module that models the proof-of-work blockchain systems
 """
 import time
 
+from buckets import BucketQueue, bucket_edges
 from models import Block, Tx, RoomState
-from processes import MapDoublePh, MDoubleM
+from processes import ARRIVAL, BROADCAST, EVENT_NAMES, SELECTION, MapDoublePh, MDoubleM
 
 
-def simulation(scheduler, g, b, sigma, tau, upsilon, fees, ratios):
+# transactions selection policies
+POLICIES = ('random', 'fees', 'weight')
+
+
+class System:
+    """
+    Waiting room and server of a blockchain system, selecting transactions with its own policy and block size.
+
+    Several systems can be driven by the same scheduler, they then share the same arrivals, selections and broadcasts.
+    It records the transactions, blocks and waiting room states when told to.
+    """
+
+    def __init__(self, g, policy, b, W=None, edges=None):
+        """
+        :param g: pseudo random generator used to randomly select transactions
+        :param policy: transactions selection policy, one of POLICIES
+        :param b: max number of transactions in a block
+        :param W: max weight of a block (weight policy only)
+        :param edges: edges between the buckets of fee / weight ratios, see buckets.bucket_edges (weight policy only)
+        """
+        assert policy in POLICIES, f"Unknown policy {policy!a}, should be one of {POLICIES}."
+
+        self.g = g
+        self.policy = policy
+        self.b = b
+        self.W = W
+
+        self.waiting_room = BucketQueue(edges) if policy == 'weight' else []
+        self.server_room = []
+        self.block = None
+
+        self.transactions = []
+        self.blocks = []
+        self.room_states = []
+
+    def arrival(self, t, ratio, weight, record):
+        """
+        :param t: time of the arrival
+        :param ratio: fee / weight ratio of the arriving transaction
+        :param weight: weight of the arriving transaction
+        :param record: if the arrival must be recorded
+        """
+        tx = Tx(ratio=ratio, arrival=t, weight=weight)
+        self.waiting_room.append(tx)
+
+        if record:
+            self.transactions.append(tx)
+            self.room_states.append(RoomState(t=t, size=len(self.waiting_room)))
+
+    def selection(self, t, record):
+        """
+        :param t: time of the selection
+        :param record: if the selection must be recorded
+        """
+        b = self.b
+        if self.policy == 'weight':
+            self.server_room = self.waiting_room.pack(self.W, b)
+        elif b >= len(self.waiting_room):
+            self.waiting_room, self.server_room = [], self.waiting_room
+        elif self.policy == 'fees':
+            self.waiting_room.sort()
+            self.server_room = [self.waiting_room.pop() for _ in range(b)]
+        else:
+            self.g.shuffle(self.waiting_room)
+            self.waiting_room, self.server_room = self.waiting_room[b:], self.waiting_room[:b]
+
+        for tx in self.server_room:
+            tx.selection = t
+
+        self.block = Block(selection=t, size=len(self.server_room))
+
+        if record:
+            self.blocks.append(self.block)
+            self.room_states.append(RoomState(t=t, size=len(self.waiting_room)))
+
+    def broadcast(self, t):
+        """
+        :param t: time of the broadcast
+        """
+        self.block.broadcast = t
+        for tx in self.server_room:
+            tx.broadcast = t
+
+    def measures(self):
+        """
+        :return: the recorded measures, a mapping with keys transactions, blocks and room_states;
+         respectively a list of Tx, a list of Block and a list of RoomState.
+        """
+        return {
+            'transactions': self.transactions,
+            'blocks': self.blocks,
+            'room_states': self.room_states,
+        }
+
+
+def on_arrival(t, systems, g, ratios, weights, fees, record):
+    """
+    Handle an arrival: each system receives a transaction with the same ratio and weight.
+    See step for the parameters.
+    """
+    if fees:
+        idx = g.integers(len(ratios))
+        ratio, weight = ratios[idx], weights[idx]
+    else:
+        ratio, weight = 0, 0
+    for system in systems:
+        system.arrival(t, ratio, weight, record)
+
+
+def on_selection(t, systems, g, ratios, weights, fees, record):
+    """
+    Handle a selection, see step for the parameters.
+    """
+    for system in systems:
+        system.selection(t, record)
+
+
+def on_broadcast(t, systems, g, ratios, weights, fees, record):
+    """
+    Handle a broadcast, see step for the parameters.
     """
-    Simulate the blockchain system from t=0 to t=tau+sigma
+    for system in systems:
+        system.broadcast(t)
 
-    :param scheduler: Control the flow of time (self.t) and events (self.next)
+
+# handlers of the events, indexed by their code
+HANDLERS = [None] * len(EVENT_NAMES)
+HANDLERS[ARRIVAL] = on_arrival
+HANDLERS[SELECTION] = on_selection
+HANDLERS[BROADCAST] = on_broadcast
+
+
+def step(scheduler, systems, g, ratios, weights, fees, sigma, tau):
+    """
+    Advance the scheduler to its next event, and apply the event to the systems.
+
+    :param scheduler: Control the flow of time (self.t) and events (self.next), see processes.Scheduler
+    :param systems: list of System driven by the scheduler
+    :param g: pseudo random generator used to choose fees
+    :param ratios: a list of fee on weight ratios to randomly choose from
+    :param weights: the weights of the transactions, sampled along the ratios
+    :param fees: if arriving transactions receive a ratio and a weight, 0 otherwise
+    :param sigma: time to start recording transaction arrivals and block selections
+    :param tau: time to stop recording transactions arrivals and block selections
+    :return: the code of the event
+    """
+    event = scheduler.next()
+    HANDLERS[event](scheduler.t, systems, g, ratios, weights, fees, sigma <= scheduler.t < tau)
+    return event
+
+
+def simulation(scheduler, g, configurations, sigma, tau, upsilon, ratios, weights, W):
+    """
+    Simulate blockchain systems from t=0 to t=tau+sigma.
+
+    All the systems are driven by the same sequence of events, so that the scheduler runs only once, however
+    many configurations there are. They also receive transactions with the same fee / weight ratios and weights.
+
+    :param scheduler: Control the flow of time (self.t) and events (self.next), see processes.Scheduler
     :param g: pseudo random generator used to randomly select transactions or choose fees
-    :param b: max number of transactions in a block
+    :param configurations: list of (policy, b), one per system to simulate;
+     policy is one of POLICIES ('fees' to prioritize transactions according to their fees, 'weight' to also limit the
+     weight of blocks to W, 'random' otherwise) and b is the max number of transactions in a block.
     :param sigma: time to start recording transaction arrivals and block selections
     :param tau: time to stop recording transactions arrivals and block selections
     :param upsilon: extra time to continue record transaction and block broadcast
-    :param fees: if fees must be used to prioritize transactions, random otherwise
     :param ratios: a list of fee on weight ratios to randomly choose from
-    :return: the measures recorded during the simulation, a mapping with keys transactions, blocks and room_states;
-     respectively a list of Tx, a list of Block and a list of RoomState.
+    :param weights: the weights of the transactions, sampled along the ratios
+    :param W: max weight of a block
+    :return: the measures recorded during the simulation, one per configuration (see System.measures)
     """
     print("Simulation started.")
     start = time.perf_counter()
 
-    transactions = []
-    blocks = []
-    room_states = []
-
-    waiting_room = []
-    server_room = []
-    block = None
+    edges = bucket_edges(ratios)
+    systems = [System(g, policy, b, W, edges) for policy, b in configurations]
+    # ratios and weights are only meaningful if a system selects transactions according to their fees
+    fees = any(system.policy != 'random' for system in systems)
 
     while scheduler.t < tau + upsilon:
-        event_name = scheduler.next()
-
-        if event_name == 'arrival':
-            if fees:
-                tx = Tx(ratio=g.choice(ratios), arrival=scheduler.t)
-            else:
-                tx = Tx(ratio=0, arrival=scheduler.t)
-
-            waiting_room.append(tx)
-
-            if sigma <= scheduler.t < tau:
-                transactions.append(tx)
-                room_states.append(RoomState(t=scheduler.t, size=len(waiting_room)))
-        elif event_name == 'selection':
-            if b >= len(waiting_room):
-                waiting_room, server_room = [], waiting_room
-            elif fees:
-                waiting_room.sort()
-                server_room = [waiting_room.pop() for _ in range(b)]
-            else:
-                g.shuffle(waiting_room)
-                waiting_room, server_room = waiting_room[b:], waiting_room[:b]
-
-            for tx in server_room:
-                tx.selection = scheduler.t
-
-            block = Block(selection=scheduler.t, size=len(server_room))
-
-            if sigma <= scheduler.t < tau:
-                blocks.append(block)
-                room_states.append(RoomState(t=scheduler.t, size=len(waiting_room)))
-        elif event_name == 'broadcast':
-            block.broadcast = scheduler.t
-            for tx in server_room:
-                tx.broadcast = scheduler.t
+        step(scheduler, systems, g, ratios, weights, fees, sigma, tau)
 
     print(f"Simulation finished in {time.perf_counter() - start:.0f} seconds.")
-    return {
-        'transactions': transactions,
-        'blocks': blocks,
-        'room_states': room_states,
-    }
+    return [system.measures() for system in systems]
 
 
-def mm1_simulation(generators,
-                   b, sigma, tau, upsilon,
+def mm1_simulation(generators, configurations,
+                   sigma, tau, upsilon,
                    _lambda,
                    mu1,
                    mu2,
-                   fees, ratios,
+                   ratios, weights, W,
                    **p):
     """
-    Simulate the blockchain system with a M/M/1 queue.
+    Simulate the blockchain systems with a M/M/1 queue.
 
     See method simulation for undocumented parameters.
 
@@ -99,18 +215,18 @@ def mm1_simulation(generators,
     """
     scheduler = MDoubleM(generators, _lambda, mu1, mu2)
 
-    return simulation(scheduler, generators[3], b, sigma, tau, upsilon, fees, ratios)
+    return simulation(scheduler, generators[3], configurations, sigma, tau, upsilon, ratios, weights, W)
 
 
-def map_ph_simulation(generators,
-                      b, sigma, tau, upsilon,
+def map_ph_simulation(generators, configurations,
+                      sigma, tau, upsilon,
                       C, D, omega,
                       S, beta,
                       T, alpha,
-                      fees, ratios,
+                      ratios, weights, W,
                       **p):
     """
-    Simulate the blockchain system with a MAP/PH/1 queue.
+    Simulate the blockchain systems with a MAP/PH/1 queue.
 
     See method simulation for undocumented parameters.
 
@@ -127,4 +243,4 @@ def map_ph_simulation(generators,
     """
     scheduler = MapDoublePh(generators, C, D, omega, S, beta, T, alpha)
 
-    return simulation(scheduler, generators[8], b, sigma, tau, upsilon, fees, ratios)
+    return simulation(scheduler, generators[8], configurations, sigma, tau, upsilon, ratios, weights, W)
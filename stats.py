@@ -1,10 +1,170 @@
 """
 Module to compute statistical measure to print to the console
 """
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from operator import attrgetter
+
 import numpy as np
+from numpy.random import SeedSequence, SFC64, Generator
+
+# summarized measures, with their label and format
+METRICS = {
+    'sojourn_durations': ('sojourn duration', '.0f'),
+    'waiting_durations': ('waiting duration', '.0f'),
+    'service_durations': ('service duration', '.0f'),
+    'inter_block_times': ('block time', '.0f'),
+    'block_sizes': ('block size', '.0f'),
+    'room_sizes': ('waiting room size', '.0f'),
+    'inter_arrival_times': ('inter-arrival times', '.3f'),
+}
+PERCENTILES = (50, 90, 99)
+# confidence interval methods
+METHODS = ('batch-means', 'bootstrap')
+# number of batches of the batch means method
+BATCHES = 32
+# number of blocks and resamples of the bootstrap method, resamples are drawn by chunks of numpy operations
+BOOTSTRAP_BLOCKS = 200
+RESAMPLES = 1000
+RESAMPLES_CHUNK = 100
+# metrics are summarized in parallel when one of them has more values than this
+PARALLEL_SIZE = 10 ** 6
+
+
+@dataclass
+class Metric:
+    count: int  # number of values, nan excluded
+    mean: float
+    low: float  # lower bound of the confidence interval of the mean
+    high: float  # upper bound of the confidence interval of the mean
+    p50: float
+    p90: float
+    p99: float
+
+
+@dataclass
+class Summary:
+    transactions: int  # number of recorded transactions
+    non_mined: int  # number of recorded transactions never selected
+    non_broadcast: int  # number of recorded transactions never broadcast
+    metrics: dict  # Metric of each of METRICS
+    method: str  # method of the confidence intervals, one of METHODS
+    confidence: float  # confidence level of the intervals
+
+    def line(self, name):
+        """
+        :param name: one of METRICS
+        :return: the mean of the metric, its confidence interval and its percentiles as text
+        """
+        label, fmt = METRICS[name]
+        metric = self.metrics[name]
+        return (f"Average {label} : {metric.mean:{fmt}} [{metric.low:{fmt}}, {metric.high:{fmt}}] "
+                f"(p50 {metric.p50:{fmt}}, p90 {metric.p90:{fmt}}, p99 {metric.p99:{fmt}})")
+
+    @property
+    def text(self):
+        """
+        :return: the summary as printed by compute_print_stats
+        """
+        transactions = max(self.transactions, 1)
+        return f"""
+    All transactions : {self.transactions} (100%)
+    Non mined transactions : {self.non_mined} ({self.non_mined / transactions:.3%})
+    Non broadcast transactions : {self.non_broadcast} ({self.non_broadcast / transactions:.3%})
+
+    {self.line('sojourn_durations')}
+    {self.line('waiting_durations')}
+    {self.line('service_durations')}
+
+    {self.line('inter_block_times')}
+    {self.line('block_sizes')}
+
+    {self.line('room_sizes')}
+
+    {self.line('inter_arrival_times')}
+
+    Confidence intervals : {self.confidence:.0%} ({self.method})
+    """
+
+
+def columns(records, names, dtype=float):
+    """
+    :param records: list of records (Tx, Block or RoomState), or numpy record array with the same fields
+    :param names: names of the fields
+    :param dtype: type of the returned arrays
+    :return: the fields of all the records as arrays, None values becoming nan; the records are read in a single pass
+    """
+    if isinstance(records, np.ndarray):
+        return [records[name].astype(dtype) for name in names]
+    values = np.array(list(map(attrgetter(*names), records)), dtype=dtype)
+    return list(values.reshape(-1, len(names)).T)
+
+
+def batch_sums(values, batches):
+    """
+    :param values: array of values, in the order they were observed
+    :param batches: number of consecutive batches, at most len(values)
+    :return: the sum and the number of the values of each batch
+    """
+    edges = np.arange(batches) * len(values) // batches
+    return np.add.reduceat(values, edges), np.diff(np.append(edges, len(values)))
+
+
+def batch_means_interval(values, confidence):
+    """
+    Confidence interval of the mean from the means of consecutive batches, which are nearly independent even if
+    successive values are correlated (as the durations of successive transactions are).
+    """
+    batches = min(BATCHES, len(values))
+    sums, counts = batch_sums(values, batches)
+    means = sums / counts
+    # scipy is only imported when an interval is computed
+    from scipy.stats import t
+    half_width = t.ppf((1 + confidence) / 2, batches - 1) * means.std(ddof=1) / np.sqrt(batches)
+    mean = values.mean()
+    return mean - half_width, mean + half_width
+
+
+def bootstrap_interval(values, confidence, g):
+    """
+    Percentile confidence interval of the mean from a block bootstrap: consecutive blocks of values are resampled, so
+    that the correlation within blocks is preserved. Resampling blocks sums, it costs O(RESAMPLES * BOOTSTRAP_BLOCKS)
+    whatever the number of values.
+    """
+    blocks = min(BOOTSTRAP_BLOCKS, len(values))
+    sums, counts = batch_sums(values, blocks)
+    means = np.empty(RESAMPLES)
+    for start in range(0, RESAMPLES, RESAMPLES_CHUNK):
+        resamples = g.integers(blocks, size=(min(RESAMPLES_CHUNK, RESAMPLES - start), blocks))
+        means[start:start + len(resamples)] = sums[resamples].sum(axis=1) / counts[resamples].sum(axis=1)
+    low, high = np.quantile(means, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return low, high
 
 
-def compute_print_stats(transactions, blocks, room_states):
+def summarize(values, method, confidence, g):
+    """
+    :param values: array of values of a metric, nan values are ignored
+    :param method: method of the confidence interval, one of METHODS
+    :param confidence: confidence level of the interval
+    :param g: pseudo random generator used by the bootstrap
+    :return: the Metric of the values, nan where undefined
+    """
+    values = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+    if not len(values):
+        return Metric(0, *[np.nan] * 6)
+
+    mean = values.mean()
+    if len(values) < 2:
+        low, high = np.nan, np.nan
+    elif method == 'bootstrap':
+        low, high = bootstrap_interval(values, confidence, g)
+    else:
+        low, high = batch_means_interval(values, confidence)
+    percentiles = np.percentile(values, PERCENTILES)
+    return Metric(len(values), float(mean), float(low), float(high), *map(float, percentiles))
+
+
+def compute_print_stats(transactions, blocks, room_states, method='batch-means', confidence=0.95, seed=0):
     """
     Print statistical measures from received data, and return a dictionary with:
     - arrivals
@@ -18,30 +178,27 @@ def compute_print_stats(transactions, blocks, room_states):
     - block_sizes
     - room_times
     - room_sizes
+    - summary
 
-    Under each key is a list of float ready to be used for graphs
+    Under each key is a list of float ready to be used for graphs, except under summary: the printed Summary, with
+    the mean, confidence interval and percentiles of each of METRICS.
 
-    :param transactions: list of recorded transactions
-    :param blocks:  list of recorded blocks
-    :param room_states: list of recorded waiting room states
+    :param transactions: list of recorded transactions (or record array)
+    :param blocks:  list of recorded blocks (or record array)
+    :param room_states: list of recorded waiting room states (or record array)
+    :param method: method of the confidence intervals, one of METHODS
+    :param confidence: confidence level of the intervals
+    :param seed: seed of the pseudo random generators used by the bootstrap
 
     :return: a dictionary with all sorts of measures
     """
-    stats = {
-        'arrivals': np.empty(len(transactions)),
-        'services': np.empty(len(transactions)),
-        'completions': np.empty(len(transactions))
-    }
-
-    if any(tx.ratio for tx in transactions):
-        stats['ratios'] = np.empty(len(transactions))
-
-    for idx, tx in enumerate(transactions):
-        stats['arrivals'][idx] = tx.arrival
-        stats['services'][idx] = tx.selection
-        stats['completions'][idx] = tx.broadcast
-        if 'ratios' in stats:
-            stats['ratios'][idx] = tx.ratio
+    assert method in METHODS, f"Unknown method {method!a}, should be one of {METHODS}."
+
+    stats = {}
+    ratios, stats['arrivals'], stats['services'], stats['completions'] = \
+        columns(transactions, ['ratio', 'arrival', 'selection', 'broadcast'])
+    if ratios.any():
+        stats['ratios'] = ratios
 
     stats['inter_arrival_times'] = np.ediff1d(stats['arrivals'])
     stats['sojourn_durations'] = stats['completions'] - stats['arrivals']
@@ -49,32 +206,32 @@ def compute_print_stats(transactions, blocks, room_states):
     stats['service_durations'] = stats['completions'] - stats['services']
 
     # ignore last block if not mined, very unlikely if sufficient extra time is provided
-    if blocks[-1].broadcast is None:
-        blocks = blocks[:-1]
-    stats['inter_block_times'] = np.ediff1d([b.broadcast for b in blocks])
-    stats['block_sizes'] = np.array([b.size for b in blocks], dtype=int)
-
-    stats['room_times'] = np.array([s.t for s in room_states])
-    stats['room_sizes'] = np.array([s.size for s in room_states], dtype=int)
-
-    no_selection = np.isnan(stats['services']).sum()
-    no_broadcast = np.isnan(stats['completions']).sum()
-
-    print(f"""
-    All transactions : {len(transactions)} (100%)
-    Non mined transactions : {no_selection} ({no_selection / len(stats['services']):.3%})
-    Non broadcast transactions : {no_broadcast} ({no_broadcast / len(stats['completions']):.3%})
-    
-    Average sojourn duration : {np.nanmean(stats['sojourn_durations']):.0f}
-    Average waiting duration : {np.nanmean(stats['waiting_durations']):.0f}
-    Average service duration : {np.nanmean(stats['service_durations']):.0f}
-
-    Average block time : {stats['inter_block_times'].mean():.0f}
-    Average block size: {stats['block_sizes'].mean():.0f}
-    
-    Average waiting room size: {stats['room_sizes'].mean():.0f}
-
-    Average inter-arrival times : {stats['inter_arrival_times'].mean():.3f}    
-    """)
+    block_broadcasts, block_sizes = columns(blocks, ['broadcast', 'size'])
+    if len(block_broadcasts) and np.isnan(block_broadcasts[-1]):
+        block_broadcasts, block_sizes = block_broadcasts[:-1], block_sizes[:-1]
+    stats['inter_block_times'] = np.ediff1d(block_broadcasts)
+    stats['block_sizes'] = block_sizes.astype(int)
+
+    stats['room_times'], room_sizes = columns(room_states, ['t', 'size'])
+    stats['room_sizes'] = room_sizes.astype(int)
+
+    generators = [Generator(SFC64(stream)) for stream in SeedSequence(seed).spawn(len(METRICS))]
+    tasks = [(stats[name], method, confidence, g) for name, g in zip(METRICS, generators)]
+    if max(len(values) for values, *_ in tasks) > PARALLEL_SIZE:
+        # numpy releases the GIL while partitioning and summing large arrays
+        with ThreadPoolExecutor(len(tasks)) as executor:
+            metrics = list(executor.map(lambda task: summarize(*task), tasks))
+    else:
+        metrics = [summarize(*task) for task in tasks]
+
+    summary = Summary(transactions=len(stats['arrivals']),
+                      non_mined=int(np.isnan(stats['services']).sum()),
+                      non_broadcast=int(np.isnan(stats['completions']).sum()),
+                      metrics=dict(zip(METRICS, metrics)),
+                      method=method,
+                      confidence=confidence)
+    stats['summary'] = summary
+
+    print(summary.text)
 
     return stats
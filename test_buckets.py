@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+import numpy as np
+
+from buckets import BucketQueue, bucket_edges
+from models import Tx
+
+
+class TestBucketQueue(TestCase):
+    def test_edges(self):
+        """
+        This test checks that each distinct ratio has its own bucket when there are few of them
+        """
+        self.assertEqual(bucket_edges([3, 1, 2, 2, 1]), [2, 3])
+        self.assertEqual(len(bucket_edges(range(1000), buckets=10)), 9)
+
+    def test_pack(self):
+        """
+        This test checks that packing takes the highest ratios first, in arrival order within a bucket,
+        and skips the transactions that don't fit for the next ones that do
+        """
+        room = BucketQueue(bucket_edges([1, 2, 3]))
+        txs = [Tx(ratio=2, arrival=0, weight=4),
+               Tx(ratio=3, arrival=1, weight=3),
+               Tx(ratio=2, arrival=2, weight=2),
+               Tx(ratio=1, arrival=3, weight=1),
+               Tx(ratio=2, arrival=4, weight=1)]
+        for tx in txs:
+            room.append(tx)
+
+        self.assertEqual(room.pack(capacity=8, max_count=10), [txs[1], txs[0], txs[4]])
+        self.assertEqual(len(room), 2)
+        self.assertEqual(room.pack(capacity=10, max_count=1), [txs[2]])
+        self.assertEqual(room.pack(capacity=10, max_count=10), [txs[3]])
+        self.assertEqual(len(room), 0)
+
+    def test_pack_greedy(self):
+        """
+        This test checks that packing matches a greedy selection by decreasing ratio, arrival order breaking ties
+        """
+        g = np.random.default_rng(0)
+        ratios = g.integers(1, 20, 2000).astype(float)
+        room = BucketQueue(bucket_edges(ratios))
+        txs = [Tx(ratio=ratio, arrival=t, weight=g.integers(1, 50)) for t, ratio in enumerate(ratios)]
+        for tx in txs:
+            room.append(tx)
+
+        for capacity, max_count in [(1000, 10 ** 6), (5000, 100), (3, 10 ** 6)] * 3:
+            expected = []
+            left = capacity
+            for tx in sorted(txs, key=lambda tx: (-tx.ratio, tx.arrival)):
+                if len(expected) < max_count and tx.weight <= left:
+                    expected.append(tx)
+                    left -= tx.weight
+            self.assertEqual(room.pack(capacity, max_count), expected)
+            txs = [tx for tx in txs if tx not in expected]
+            self.assertEqual(len(room), len(txs))
@@ -0,0 +1,53 @@
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from cache import ResultCache, fingerprint
+
+
+class TestResultCache(TestCase):
+    def test_fingerprint(self):
+        """
+        This test checks that the fingerprint changes with any parameter value or context value
+        """
+        p = {'b': np.array(10), 'C': np.array([[-1.3, 0.3], [0.5, -1.5]])}
+        reference = fingerprint(p, entropy=1, fees=True)
+
+        self.assertEqual(reference, fingerprint(dict(p), entropy=1, fees=True))
+        self.assertNotEqual(reference, fingerprint({**p, 'b': np.array(11)}, entropy=1, fees=True))
+        self.assertNotEqual(reference, fingerprint(p, entropy=2, fees=True))
+        self.assertNotEqual(reference, fingerprint(p, entropy=1, fees=False))
+
+    def test_lru_eviction(self):
+        """
+        This test checks that the least recently used entry is evicted when the cache is full
+        """
+        with TemporaryDirectory() as directory:
+            cache = ResultCache(Path(directory), max_size=2500)
+            cache.put('a', bytes(1000))
+            cache.put('b', bytes(1000))
+            os.utime(cache.path('a'), (0, 0))
+            os.utime(cache.path('b'), (1, 1))
+
+            self.assertEqual(cache.get('a'), bytes(1000))  # 'a' becomes the most recently used
+            cache.put('c', bytes(1000))
+
+            self.assertIsNotNone(cache.get('a'))
+            self.assertIsNone(cache.get('b'))
+            self.assertIsNotNone(cache.get('c'))
+
+    def test_entry_larger_than_cache(self):
+        """
+        This test checks that an entry larger than the cache is kept until another entry is stored
+        """
+        with TemporaryDirectory() as directory:
+            cache = ResultCache(Path(directory), max_size=500)
+            cache.put('a', bytes(1000))
+            self.assertEqual(cache.get('a'), bytes(1000))
+
+            cache.put('b', bytes(10))
+            self.assertIsNone(cache.get('a'))
+            self.assertIsNotNone(cache.get('b'))
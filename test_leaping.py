@@ -0,0 +1,67 @@
+import contextlib
+import io
+from math import exp, factorial
+from unittest import TestCase
+
+import numpy as np
+from numpy.random import SeedSequence, SFC64, Generator
+
+from leaping import Room, counting_table, leaping_simulation
+from simulations import map_ph_simulation
+from stats import compute_print_stats
+
+P = {
+    'sigma': 2000, 'tau': 60_000, 'upsilon': 2000,
+    'C': np.array([[-1.3, 0.3], [0.5, -1.5]]), 'D': np.array([[0.8, 0.2], [0.1, 0.9]]), 'omega': np.array([0.5, 0.5]),
+    'S': np.array([[-0.2]]), 'beta': np.array([1.]),
+    'T': np.array([[-0.5, 0.25], [0., -0.5]]), 'alpha': np.array([0.5, 0.5]),
+    'ratios': np.array([1., 2., 5.]), 'weights': np.array([1., 1., 1.]), 'W': 1,
+}
+
+
+def generators(seed):
+    return [Generator(SFC64(stream)) for stream in SeedSequence(seed).spawn(10)]
+
+
+class TestLeaping(TestCase):
+    def test_counting_table_poisson(self):
+        """
+        This test checks that the number of arrivals of a Poisson process during a leap is Poisson distributed
+        """
+        cumulative, truncated = counting_table(np.array([[-2.]]), np.array([[2.]]), 3)
+        probabilities = np.diff(cumulative[0], prepend=0)
+
+        self.assertLess(truncated, 1e-12)
+        expected = [exp(-6) * 6 ** n / factorial(n) for n in range(len(probabilities))]
+        np.testing.assert_allclose(probabilities, expected, atol=1e-12)
+
+    def test_fees_ties(self):
+        """
+        This test checks that among equal ratios, the latest arrivals are selected first, as in the exact simulation
+        """
+        room = Room(None, 'fees', 3)
+        all_ratios = np.array([1., 2., 1., 2., 1., 0.])
+        room.arrivals(np.arange(6), np.arange(6.), np.zeros(6, dtype=bool))
+        room.selection(6, all_ratios, False)
+
+        self.assertEqual(sorted(room.server_room), [1, 3, 4])
+        self.assertEqual(list(room.waiting_room), [0, 2, 5])
+
+    def test_exact_means(self):
+        """
+        This test checks that the means of the leaping simulation are within the confidence intervals of the exact
+        simulation, on a small MAP/PH/1 queue
+        """
+        configurations = [('random', 10), ('fees', 10)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            exact = [compute_print_stats(**measures)['summary']
+                     for measures in map_ph_simulation(generators(1), configurations, **P)]
+            approximate = [compute_print_stats(**measures)['summary']
+                           for measures in leaping_simulation(generators(2), configurations, **P)]
+
+        for exact_summary, approximate_summary in zip(exact, approximate):
+            for name in ['sojourn_durations', 'block_sizes', 'room_sizes', 'inter_arrival_times']:
+                exact_metric, approximate_metric = exact_summary.metrics[name], approximate_summary.metrics[name]
+                # both estimates are uncertain, their intervals must overlap
+                self.assertLess(approximate_metric.low, exact_metric.high, name)
+                self.assertGreater(approximate_metric.high, exact_metric.low, name)
@@ -2,39 +2,49 @@ from unittest import TestCase
 
 from processes import MapDoublePh
 import numpy as np
+from scipy import sparse
+
+C = [[-1.3, 0.3], [0.5, -1.5]]
+D = [[0.05, 0.95], [0.15, 0.85]]
+S = [[-0.1, 0.08], [0.06, -0.1]]
+T = [[-0.001, 0], [0, -0.001]]  # unused in these tests
 
 
 class TestMap(TestCase):
-    def test_get_next_state_prob_vector(self):
+    def assertTransitions(self, actual, expected_targets, expected_weights):
+        targets, cumulative = actual
+        expected_weights = np.array(expected_weights)
+        self.assertTrue(np.array_equal(targets, expected_targets))
+        self.assertTrue(np.allclose(cumulative, np.cumsum(expected_weights) / expected_weights.sum()))
+
+    def check_transitions(self, mapPh):
+        # MAP transitions : silent phase changes (C) then arrivals (D)
+        self.assertTransitions(mapPh.map.transitions[0], [1, 2, 3], [0.3, 0.05, 0.95])
+        self.assertTransitions(mapPh.map.transitions[1], [0, 2, 3], [0.5, 0.15, 0.85])
+        self.assertTrue(np.allclose(mapPh.map.exit_rates, [1.3, 1.5]))
+
+        # PH transitions : phase changes (S) then absorption
+        self.assertTransitions(mapPh.ph.transitions[0], [1, 2], [0.08, 0.02])
+        self.assertTransitions(mapPh.ph.transitions[1], [0, 2], [0.06, 0.04])
+        self.assertTrue(np.allclose(mapPh.ph.exit_rates, [0.1, 0.1]))
+
+    def test_transitions(self):
+        """
+        This test checks that the transition tables select the right rows of the map and ph,
+        and only keep their non zero entries
+        """
+        mapPh = MapDoublePh([np.random.default_rng(0)] * 10,
+                            C, D, [0.3, 0.7],
+                            S, [0.2, 0.8],
+                            T, [0.1, 0.9])
+        self.check_transitions(mapPh)
+
+    def test_sparse_transitions(self):
         """
-        This test checks that test_get_next_state_prob_vector selects the right rows of the map and ph
-        :return:
+        This test checks that sparse matrices give the same transition tables as dense ones
         """
-        mapPh = MapDoublePh(np.random,
-                            [[-1.3, 0.3], [0.5, -1.5]],
-                            [[0.05, 0.95], [0.15, 0.85]],
-                            [0.3, 0.7],
-                            [[-0.1, 0.08], [0.06, -0.1]],
-                            [0.2, 0.8],
-                            [[-0.001, 0], [0, -0.001]],  # unused in this test
-                            [0.1, 0.9])  # unused in this test
-
-        actual = mapPh.get_next_state_prob_vector(mapPh.ph, 0, 0)
-        expected = np.array([0, 0.3, 0.05, 0.95, 0, 0.08, 0.02])
-        expected /= expected.sum()
-        self.assertTrue(np.allclose(actual, expected))
-
-        actual = mapPh.get_next_state_prob_vector(mapPh.ph, 1, 0)
-        expected = np.array([0.5, 0, 0.15, 0.85, 0, 0.08, 0.02])
-        expected /= expected.sum()
-        self.assertTrue(np.allclose(actual, expected))
-
-        actual = mapPh.get_next_state_prob_vector(mapPh.ph, 0, 1)
-        expected = np.array([0, 0.3, 0.05, 0.95, 0.06, 0, 0.04])
-        expected /= expected.sum()
-        self.assertTrue(np.allclose(actual, expected))
-
-        actual = mapPh.get_next_state_prob_vector(mapPh.ph, 1, 1)
-        expected = np.array([0.5, 0, 0.15, 0.85, 0.06, 0, 0.04])
-        expected /= expected.sum()
-        self.assertTrue(np.allclose(actual, expected))
+        mapPh = MapDoublePh([np.random.default_rng(0)] * 10,
+                            sparse.csr_matrix(C), sparse.coo_matrix(D), [0.3, 0.7],
+                            sparse.csr_matrix(S), [0.2, 0.8],
+                            sparse.csr_matrix(T), [0.1, 0.9])
+        self.check_transitions(mapPh)
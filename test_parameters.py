@@ -0,0 +1,90 @@
+import pickle
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from parameters import Parameters
+
+PARAMETERS = {
+    'b': 10, 'sigma': 0.1, 'tau': 1000, 'upsilon': 0.1,
+    'lambda': 1, 'mu1': 5, 'mu2': 0.5,
+    'C': [[-1.3, 0.3], [0.5, -1.5]], 'D': [[0.8, 0.2], [0.1, 0.9]], 'omega': [0.6, 0.4],
+    'S': [[-2.0, 1.0], [0.0, -3.0]], 'beta': [1.0, 0.0],
+    'T': [[-4.0, 1.0], [0.0, -2.0]], 'alpha': [0.5, 0.5],
+    'ratios': [1, 2, 5], 'weights': [500, 250, 1000], 'W': 4000,
+}
+
+
+def write_parameters(directory):
+    for name, value in PARAMETERS.items():
+        np.savetxt(directory / f'{name}.csv', np.atleast_1d(value), delimiter=',', fmt='%g')
+
+
+class TestBundle(TestCase):
+    def test_compile_load(self):
+        """
+        This test checks that a compiled bundle holds the same parameters as the directory it is compiled from
+        """
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            parameters_dir = directory / 'parameters'
+            parameters_dir.mkdir()
+            write_parameters(parameters_dir)
+            bundle = directory / 'parameters.bundle'
+
+            Parameters.compile(parameters_dir, bundle)
+            expected = Parameters.load(parameters_dir)
+            actual = Parameters.load(bundle)
+
+            self.assertEqual(expected.keys(), actual.keys())
+            for name in expected:
+                np.testing.assert_array_equal(expected[name], actual[name])
+            self.assertEqual(actual['sigma'], 100)
+
+    def test_corrupted_bundle(self):
+        """
+        This test checks that a bundle whose parameters don't match its fingerprint is rejected
+        """
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            parameters_dir = directory / 'parameters'
+            parameters_dir.mkdir()
+            write_parameters(parameters_dir)
+            bundle = directory / 'parameters.bundle'
+            Parameters.compile(parameters_dir, bundle)
+
+            content = pickle.loads(bundle.read_bytes())
+            content['parameters']['b'] = np.array(11)
+            bundle.write_bytes(pickle.dumps(content))
+
+            with self.assertRaises(AssertionError):
+                Parameters.load(bundle)
+
+    def test_outdated_bundle(self):
+        """
+        This test checks that a bundle is rejected once a file of its parameters directory is modified
+        """
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            parameters_dir = directory / 'parameters'
+            parameters_dir.mkdir()
+            write_parameters(parameters_dir)
+            bundle = directory / 'parameters.bundle'
+            Parameters.compile(parameters_dir, bundle)
+
+            (parameters_dir / 'b.csv').write_text('11')
+            with self.assertRaises(AssertionError):
+                Parameters.load(bundle)
+
+    def test_not_a_bundle(self):
+        """
+        This test checks that a file which isn't a bundle is rejected
+        """
+        with TemporaryDirectory() as directory:
+            for content in [pickle.dumps([1, 2]), b'not a pickle']:
+                bundle = Path(directory) / 'parameters.bundle'
+                bundle.write_bytes(content)
+                with self.assertRaises(SystemExit):
+                    Parameters.load(bundle)
@@ -0,0 +1,47 @@
+import contextlib
+import io
+from unittest import TestCase
+
+import numpy as np
+from numpy.random import SeedSequence, SFC64, Generator
+
+from rare_events import tail_probability, warm_up
+from simulations import mm1_simulation
+from stats import summarize
+
+P = {'_lambda': 1, 'mu1': 4, 'mu2': 4, 'ratios': np.array([1.]), 'weights': np.array([1.]), 'W': 1}
+
+
+class TestTailProbability(TestCase):
+    def test_brute_force(self):
+        """
+        This test checks that the splitting estimate matches the frequency of long confirmation times in a long
+        simulation of a small M/M/1 system, within the reported error
+        """
+        threshold = 60
+        with contextlib.redirect_stdout(io.StringIO()):
+            estimate = tail_probability('mm1', SeedSequence(1), ('random', 10), threshold,
+                                        levels=4, effort=100, replications=10, sigma=200, **P)
+
+            generators = [Generator(SFC64(stream)) for stream in SeedSequence(2).spawn(10)]
+            [measures] = mm1_simulation(generators, [('random', 10)], sigma=200, tau=100_000, upsilon=2000, **P)
+        exceeds = np.array([tx.broadcast - tx.arrival > threshold for tx in measures['transactions']], dtype=float)
+        # successive confirmation times are correlated, the error of the frequency is estimated by batch means
+        frequency = summarize(exceeds, 'batch-means', 0.95, None)
+
+        self.assertGreater(frequency.mean, 0.01)
+        self.assertGreater(estimate.warmup_events, 10 * 200)
+        tolerance = 3 * estimate.relative_error * estimate.probability + (frequency.high - frequency.low) / 2
+        self.assertLess(abs(estimate.probability - frequency.mean), tolerance)
+
+    def test_clones_diverge(self):
+        """
+        This test checks that the copies of a state don't share the times of their next events
+        """
+        state, _ = warm_up('mm1', SeedSequence(1), ('random', 10), 100, 1., **P)
+        clones = [state.clone(seed) for seed in SeedSequence(2).spawn(2)]
+
+        times = [sorted(t for t, _, _ in clone.scheduler.calendar) for clone in clones]
+        self.assertNotEqual(times[0], times[1])
+        for clone_times in times:
+            self.assertGreaterEqual(min(clone_times), state.scheduler.t)
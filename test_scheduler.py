@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+import numpy as np
+
+from processes import ARRIVAL, BROADCAST, SELECTION, MapDoublePh, MDoubleM, Scheduler
+
+
+class TestScheduler(TestCase):
+    def test_calendar_order(self):
+        """
+        This test checks that the calendar pops the events in time order, skipping silent ones,
+        and that simultaneous events occur in scheduling order
+        """
+        scheduler = Scheduler()
+        scheduler.schedule(3, lambda: 'third')
+        scheduler.schedule(1, lambda: None)
+        scheduler.schedule(2, lambda: 'first')
+        scheduler.schedule(2, lambda: 'second')
+
+        self.assertEqual(scheduler.next(), 'first')
+        self.assertEqual(scheduler.next(), 'second')
+        self.assertEqual(scheduler.next(), 'third')
+        self.assertEqual(scheduler.t, 3)
+
+    def check_services_alternate(self, scheduler):
+        services = []
+        previous = 0
+        for _ in range(2000):
+            event = scheduler.next()
+            self.assertGreaterEqual(scheduler.t, previous)
+            previous = scheduler.t
+            if event != ARRIVAL:
+                services.append(event)
+
+        self.assertGreater(len(services), 2)
+        self.assertEqual(services[::2], [SELECTION] * len(services[::2]))
+        self.assertEqual(services[1::2], [BROADCAST] * len(services[1::2]))
+
+    def test_mm1_services_alternate(self):
+        """
+        This test checks that M/M/1 starts with a selection, then alternates broadcasts and selections
+        """
+        self.check_services_alternate(MDoubleM([np.random.default_rng(0)] * 10, 0.7, 50, 10))
+
+    def test_map_ph_services_alternate(self):
+        """
+        This test checks that MAP/PH/1 starts with a selection, then alternates broadcasts and selections
+        """
+        self.check_services_alternate(MapDoublePh([np.random.default_rng(0)] * 10,
+                                                  [[-1.3, 0.3], [0.5, -1.5]], [[0.5, 0.5], [0.5, 0.5]], [0.5, 0.5],
+                                                  [[-0.02, 0], [0, -0.02]], [0.5, 0.5],
+                                                  [[-0.1, 0], [0, -0.1]], [0.5, 0.5]))
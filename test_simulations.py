@@ -0,0 +1,93 @@
+import contextlib
+import io
+from unittest import TestCase
+
+import numpy as np
+from numpy.random import SeedSequence, SFC64, Generator
+
+from models import Block, RoomState, Tx
+from processes import ARRIVAL, SELECTION, MDoubleM
+from simulations import mm1_simulation
+
+P = {
+    'sigma': 100, 'tau': 2000, 'upsilon': 200,
+    '_lambda': 1, 'mu1': 10, 'mu2': 20,
+    'ratios': np.array([1., 2., 2., 5., 7.]), 'weights': np.array([400., 300., 100., 800., 200.]), 'W': 3000,
+}
+
+
+def single_policy_simulation(generators, b, sigma, tau, upsilon, fees, ratios, _lambda, mu1, mu2, **p):
+    """
+    Simulation of a single system, as it was before several configurations could share the same events
+    """
+    scheduler = MDoubleM(generators, _lambda, mu1, mu2)
+    g = generators[3]
+    transactions, blocks, room_states = [], [], []
+    waiting_room, server_room, block = [], [], None
+
+    while scheduler.t < tau + upsilon:
+        event = scheduler.next()
+        record = sigma <= scheduler.t < tau
+        if event == ARRIVAL:
+            tx = Tx(ratio=g.choice(ratios) if fees else 0, arrival=scheduler.t)
+            waiting_room.append(tx)
+            if record:
+                transactions.append(tx)
+                room_states.append(RoomState(t=scheduler.t, size=len(waiting_room)))
+        elif event == SELECTION:
+            if b >= len(waiting_room):
+                waiting_room, server_room = [], waiting_room
+            elif fees:
+                waiting_room.sort()
+                server_room = [waiting_room.pop() for _ in range(b)]
+            else:
+                g.shuffle(waiting_room)
+                waiting_room, server_room = waiting_room[b:], waiting_room[:b]
+            for tx in server_room:
+                tx.selection = scheduler.t
+            block = Block(selection=scheduler.t, size=len(server_room))
+            if record:
+                blocks.append(block)
+                room_states.append(RoomState(t=scheduler.t, size=len(waiting_room)))
+        else:
+            block.broadcast = scheduler.t
+            for tx in server_room:
+                tx.broadcast = scheduler.t
+
+    return {'transactions': transactions, 'blocks': blocks, 'room_states': room_states}
+
+
+def generators(seed):
+    return [Generator(SFC64(stream)) for stream in SeedSequence(seed).spawn(10)]
+
+
+class TestSimulation(TestCase):
+    def test_single_configuration(self):
+        """
+        This test checks that simulating a single configuration gives the same measures as a single policy simulation
+        """
+        for policy in ['random', 'fees']:
+            expected = single_policy_simulation(generators(7), b=20, fees=policy == 'fees', **P)
+            with contextlib.redirect_stdout(io.StringIO()):
+                [actual] = mm1_simulation(generators(7), [(policy, 20)], **P)
+
+            # weights were added to the transactions afterwards
+            for tx in actual['transactions']:
+                tx.weight = 0
+            self.assertEqual(expected, actual)
+
+    def test_shared_events(self):
+        """
+        This test checks that all the configurations receive the same transactions, at the same times
+        """
+        configurations = [('random', 20), ('fees', 20), ('fees', 5), ('weight', 20)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            all_measures = mm1_simulation(generators(7), configurations, **P)
+
+        reference = [(tx.arrival, tx.ratio, tx.weight) for tx in all_measures[0]['transactions']]
+        self.assertGreater(len(reference), 1000)
+        self.assertGreater(len({ratio for _, ratio, _ in reference}), 1)
+        for measures in all_measures[1:]:
+            self.assertEqual(reference, [(tx.arrival, tx.ratio, tx.weight) for tx in measures['transactions']])
+            self.assertEqual([block.selection for block in all_measures[0]['blocks']],
+                             [block.selection for block in measures['blocks']])
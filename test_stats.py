@@ -0,0 +1,55 @@
+import contextlib
+import io
+from unittest import TestCase
+
+import numpy as np
+
+from models import Block, RoomState, Tx
+from stats import compute_print_stats, summarize
+
+
+class TestStats(TestCase):
+    def test_intervals(self):
+        """
+        This test checks that both confidence intervals contain the true mean, and that nan values are ignored
+        """
+        g = np.random.default_rng(0)
+        values = g.normal(10, 2, 100_000)
+        values[::10] = np.nan
+
+        for method in ['batch-means', 'bootstrap']:
+            metric = summarize(values, method, 0.95, g)
+            self.assertEqual(metric.count, 90_000)
+            self.assertLess(metric.low, 10)
+            self.assertGreater(metric.high, 10)
+            self.assertLess(metric.high - metric.low, 0.1)
+            self.assertAlmostEqual(metric.p50, 10, delta=0.05)
+
+    def test_few_batches(self):
+        """
+        This test checks that with few batches, the batch means interval uses the quantile of the Student distribution
+        """
+        metric = summarize(np.array([1., 2., 3., 4.]), 'batch-means', 0.95, None)
+        # t quantile with 3 degrees of freedom
+        half_width = 3.182446 * np.std([1., 2., 3., 4.], ddof=1) / 2
+        self.assertAlmostEqual(metric.low, 2.5 - half_width, places=5)
+        self.assertAlmostEqual(metric.high, 2.5 + half_width, places=5)
+
+    def test_summary(self):
+        """
+        This test checks that the summary counts the non broadcast transactions, and is nan for missing measures
+        """
+        transactions = [Tx(ratio=0, arrival=t, selection=t + 1, broadcast=t + 2) for t in range(100)]
+        transactions.append(Tx(ratio=0, arrival=100))
+        room_states = [RoomState(t=t, size=1) for t in range(100)]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = compute_print_stats(transactions, [Block(selection=0, size=1)], room_states)
+        summary = stats['summary']
+
+        self.assertEqual(summary.transactions, 101)
+        self.assertEqual(summary.non_broadcast, 1)
+        self.assertEqual(summary.metrics['sojourn_durations'].mean, 2)
+        self.assertEqual(summary.metrics['sojourn_durations'].count, 100)
+        self.assertTrue(np.isnan(summary.metrics['inter_block_times'].mean))
+        self.assertIn('Average sojourn duration : 2', summary.text)
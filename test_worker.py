@@ -0,0 +1,70 @@
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from test_parameters import write_parameters
+from worker import Worker, submit
+
+
+class TestWorker(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        directory = Path(self.directory.name)
+        self.parameters_dir = directory / 'parameters'
+        self.parameters_dir.mkdir()
+        write_parameters(self.parameters_dir)
+        self.results_dir = directory / 'results'
+        self.socket_path = str(directory / 'worker.sock')
+
+        self.worker = Worker(self.socket_path, 1, self.results_dir, cache_dir=None, cache_size=0)
+        self.thread = threading.Thread(target=self.worker.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.worker.shutdown()
+        self.thread.join()
+        self.worker.server_close()
+        self.directory.cleanup()
+
+    def test_job(self):
+        """
+        This test checks that a job writes its measures and statistics in the results directory
+        """
+        response = submit(self.socket_path, parameters_dir=str(self.parameters_dir), queue='mm1', seed=1, id='job-1')
+
+        self.assertEqual(response['status'], 'done', response.get('error'))
+        self.assertEqual(response['id'], 'job-1')
+        self.assertEqual(response['results'], [str(self.results_dir / 'job-1.pickle'),
+                                               str(self.results_dir / 'job-1.txt')])
+        self.assertIn('Average sojourn duration', (self.results_dir / 'job-1.txt').read_text())
+
+    def test_failures(self):
+        """
+        This test checks that invalid jobs are answered with an error, without writing outside the results directory
+        """
+        response = submit(self.socket_path, parameters_dir=str(self.parameters_dir / 'missing'), queue='mm1')
+        self.assertEqual(response['status'], 'failed')
+        self.assertIn('missing', response['error'])
+
+        response = submit(self.socket_path, parameters_dir=str(self.parameters_dir), queue='mm1', id='../escaped')
+        self.assertEqual(response['status'], 'failed')
+        self.assertIn('id should only contain', response['error'])
+        self.assertFalse((self.results_dir.parent / 'escaped.pickle').exists())
+
+        response = submit(self.socket_path, parameters_dir=str(self.parameters_dir), queue='mm1', block_sizes=[10.0])
+        self.assertEqual(response['status'], 'failed')
+        self.assertIn('block_sizes should be positive integers', response['error'])
+
+    def test_broken_pool(self):
+        """
+        This test checks that when a process of the pool dies, only the current job fails and the next ones succeed
+        """
+        for process in self.worker.pool._processes.values():
+            process.kill()
+        response = submit(self.socket_path, parameters_dir=str(self.parameters_dir), queue='mm1', id='job-1')
+        self.assertEqual(response['status'], 'failed')
+        self.assertIn('BrokenProcessPool', response['error'])
+
+        response = submit(self.socket_path, parameters_dir=str(self.parameters_dir), queue='mm1', id='job-2')
+        self.assertEqual(response['status'], 'done', response.get('error'))
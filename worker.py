@@ -0,0 +1,255 @@
+"""
+Long-lived worker service running simulation jobs submitted over a Unix socket.
+
+The modules are imported, the parameters parsed and the MAP/PH transition tables computed only once per worker process,
+so that many short simulations don't pay for them each time.
+
+A job is a JSON object on a single line, with keys:
+- parameters_dir : path to directory containing the parameters, or to a compiled bundle
+- queue : mm1 or mapph1
+- seed (optional) : seed to initialize the pseudo random generator
+- fees (optional) : if transactions are prioritized according to offered fees, false by default
+- policy (optional) : transactions selection policy (random, fees or weight), overrides fees
+- block_sizes (optional) : max numbers of transactions in a block to simulate from the same events, [b] by default
+- id (optional) : identifier of the job made of letters, digits, _ and -, used to name its results
+
+The worker answers with a JSON object on a single line, with keys id, status (done or failed), and either the paths of
+the results and the duration of the job, or the error.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import re
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from pathlib import Path
+
+from numpy.random import SeedSequence, SFC64, Generator
+
+from cache import ResultCache
+from parameters import Parameters
+from simulations import mm1_simulation, map_ph_simulation
+from stats import compute_print_stats
+
+SIMULATIONS = {
+    'mm1': mm1_simulation,
+    'mapph1': map_ph_simulation,
+}
+
+
+@lru_cache(maxsize=32)
+def load_parameters(parameters_dir, signature):
+    """
+    :param parameters_dir: path to directory containing the parameters, or to a compiled bundle
+    :param signature: modification times of the files, so that modified parameters are parsed again
+    :return: the parameters, parsed once per directory and signature
+    """
+    return Parameters.load(Path(parameters_dir))
+
+
+def parameters_signature(parameters_dir):
+    """
+    :param parameters_dir: path to directory containing the parameters, or to a compiled bundle
+    :return: name and modification time of each file of the directory (or of the bundle)
+    """
+    path = Path(parameters_dir)
+    if path.is_file():
+        return ((path.name, path.stat().st_mtime_ns),)
+    return tuple(sorted((file.name, file.stat().st_mtime_ns) for file in path.iterdir()))
+
+
+def run_job(job, results_dir, cache_dir, cache_size):
+    """
+    Run a simulation job and write its results in results_dir:
+    - <id>.pickle : the measures of each simulated configuration
+    - <id>.txt : the output of the simulation and statistics
+
+    :param job: mapping describing the job (see module documentation)
+    :param results_dir: path of the directory receiving the results
+    :param cache_dir: path of the directory caching the measures, None to disable the cache
+    :param cache_size: maximum size of the cache in bytes
+    :return: the paths of the results
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        parameters_dir = str(job['parameters_dir'])
+        p = load_parameters(parameters_dir, parameters_signature(parameters_dir))
+
+        seed_sequence = SeedSequence(job.get('seed'))
+        print('Seed :', seed_sequence.entropy)
+        generators = [Generator(SFC64(stream)) for stream in seed_sequence.spawn(10)]
+
+        policy = job.get('policy') or ('fees' if job.get('fees') else 'random')
+        configurations = [(policy, b) for b in job.get('block_sizes') or [int(p['b'])]]
+
+        simulation = SIMULATIONS[job['queue']]
+
+        def simulate():
+            return simulation(generators, configurations, **p)
+
+        if cache_dir is None:
+            all_measures = simulate()
+        else:
+            cache = ResultCache(Path(cache_dir), cache_size)
+            all_measures = cache.get_or_run(simulate, p, seed_sequence.entropy, job['queue'], configurations)
+
+        for (policy, b), measures in zip(configurations, all_measures):
+            print(f"{job['queue']} b={b} {policy} :")
+            compute_print_stats(**measures)
+
+    measures_path = Path(results_dir) / f"{job['id']}.pickle"
+    with measures_path.open('wb') as file:
+        pickle.dump(all_measures, file, protocol=pickle.HIGHEST_PROTOCOL)
+    output_path = Path(results_dir) / f"{job['id']}.txt"
+    output_path.write_text(output.getvalue())
+
+    return [str(measures_path), str(output_path)]
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Handle a connection to the worker: each line received is a job, answered by a line once it is finished.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            start = time.perf_counter()
+            response = {}
+            try:
+                job = json.loads(line)
+                job.setdefault('id', uuid.uuid4().hex)
+                response['id'] = job['id']
+                assert job.get('queue') in SIMULATIONS, f"queue should be one of {list(SIMULATIONS)}."
+                # the id names the results files, it must not lead outside of the results directory
+                assert re.fullmatch(r'[A-Za-z0-9_-]+', str(job['id'])), "id should only contain A-Z, a-z, 0-9, _ and -."
+                block_sizes = job.get('block_sizes') or []
+                assert all(type(b) is int and b > 0 for b in block_sizes), "block_sizes should be positive integers."
+
+                pool = self.server.pool
+                try:
+                    future = pool.submit(run_job, job, self.server.results_dir,
+                                         self.server.cache_dir, self.server.cache_size)
+                    response['results'] = future.result()
+                except BrokenProcessPool:
+                    # a process died (killed, out of memory...), only this job fails, the next ones get a new pool
+                    self.server.restart_pool(pool)
+                    raise
+                response['status'] = 'done'
+            except Exception as e:
+                response['status'] = 'failed'
+                response['error'] = f"{type(e).__name__}: {e}"
+            except SystemExit as e:
+                # Parameters.get_from exits when it can't parse a file
+                response['status'] = 'failed'
+                response['error'] = str(e)
+            response['seconds'] = time.perf_counter() - start
+
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class Worker(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server dispatching the jobs to a pool of warm processes
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, processes, results_dir, cache_dir, cache_size):
+        """
+        :param socket_path: path of the Unix socket to listen to
+        :param processes: number of processes running the jobs
+        :param results_dir: path of the directory receiving the results
+        :param cache_dir: path of the directory caching the measures, None to disable the cache
+        :param cache_size: maximum size of the cache in bytes
+        """
+        self.results_dir = results_dir
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        Path(results_dir).mkdir(parents=True, exist_ok=True)
+
+        self.processes = processes
+        self.pool_lock = threading.Lock()
+        self.pool = self.start_pool()
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+        super().__init__(socket_path, JobHandler)
+
+    def start_pool(self):
+        """
+        :return: a new pool of processes, already started so that the first jobs don't pay for it
+        """
+        pool = ProcessPoolExecutor(self.processes)
+        for future in [pool.submit(time.sleep, 0) for _ in range(self.processes)]:
+            future.result()
+        return pool
+
+    def restart_pool(self, broken):
+        """
+        Replace a broken pool of processes, unless another job already did
+
+        :param broken: the pool whose processes died
+        """
+        with self.pool_lock:
+            if self.pool is broken:
+                broken.shutdown(wait=False)
+                self.pool = self.start_pool()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.server_address)
+
+
+def submit(socket_path, **job):
+    """
+    Submit a job to a running worker and wait for its completion
+
+    :param socket_path: path of the Unix socket the worker listens to
+    :param job: the job (see module documentation)
+    :return: the response of the worker
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile('rwb') as stream:
+            stream.write(json.dumps(job).encode() + b'\n')
+            stream.flush()
+            return json.loads(stream.readline())
+
+
+def main():
+    description = 'Run a worker simulating the jobs it receives on a Unix socket (see worker.py for the jobs format).'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('socket', type=str, help='path of the Unix socket to listen to')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of processes running the jobs')
+    parser.add_argument('--results-dir', type=str, default='results', help='path to directory receiving the results')
+    parser.add_argument('--cache-dir', type=str, default='.cache',
+                        help='path to directory caching the measures of previous simulations')
+    parser.add_argument('--cache-size', type=int, default=1024, help='maximum size of the cache in MiB')
+    parser.add_argument('--no-cache', action='store_true', help='always run the simulations, and do not cache them')
+    args = parser.parse_args()
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    with Worker(args.socket, args.processes, args.results_dir, cache_dir, args.cache_size * 2 ** 20) as worker:
+        print(f"Listening on {args.socket} with {args.processes} processes.")
+        try:
+            worker.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()